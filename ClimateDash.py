@@ -1,19 +1,17 @@
 # Climate Dashboard prototype notebook
 
 # import relevant functions
+import argparse
+import os
+
 import panel as pn
-import hvplot.pandas
-import pandas as pd
-import numpy as np
-import jupyter_bokeh
-import matplotlib.pyplot as plt
-from bokeh.io import curdoc
-from bokeh.io import output_notebook
-from bokeh.models import HoverTool
 
 import Climate_fx as cf
-
-hvplot.extension('bokeh')
+import Climate_bills as bills
+import Climate_heating as heating
+import Climate_history as ch
+import Climate_metrics as metrics
+import Climate_ui as ui
 
 pn.extension(design='bootstrap')
 
@@ -23,213 +21,321 @@ textcolor = 'black'
 backcolor1 = 'darkgrey'
 backcolor2 = 'lightgrey'
 
-# widget to input ZIP code and get coefficient
-ZIP_entry = pn.widgets.IntInput(name="ZIP Code",
-                                value=43017,width=intwidth,
-                                styles={'color':textcolor})
-
-##### Section 1 - Vehicles #################################
-
-# widgets to specify vehicle #1 usage
-v1t = pn.widgets.Select(name='Vehicle #1 Type',options=cf.veh_list,value='SUV-Compact-ICE')
-v1m = pn.widgets.IntSlider(name="Annual Mileage",value=0,start=0,end=30000,step=1000)
-v1h = pn.widgets.IntSlider(name='% Highway Driving',value=50,start=0,end=100,step=5)
-# detect vehicle fuel type, calculate energy usage and CO2
-v1f = pn.bind(cf.get_veh_type,cf.veh_data,v1t)
-v1_isev = pn.bind(cf.check_ev,v1t)
-v1g = pn.bind(cf.get_veh_usage,cf.veh_data,v1t,v1m,v1h,
-                retval='gal',timeconv=cf.year_to_week)  # direct calc yearly gas usage gal
-v1k = pn.bind(cf.get_veh_usage,cf.veh_data,v1t,v1m,v1h,
-                retval='kwh',timeconv=cf.year_to_week)  # direct calc yearly kwh
-v1c = pn.bind(cf.get_veh_usage,cf.veh_data,v1t,v1m,v1h,
-                retval='co2',zip=ZIP_entry,timeconv=cf.year_to_week)   # grid emissions co2
-
-# create pretty text widgets to show the vehicle coefficients
-fuel_text1a = pn.widgets.StaticText(name = "Vehicle weekly fuel (gal)",value=v1g)
-fuel_text1b = pn.widgets.StaticText(name = "Vehicle weekly energy (kWh)",value=v1k)
-co2_text1 = pn.widgets.StaticText(name = "Indirect weekly emissions (kg CO2)",value=v1c)    
-
-# widgets to specify vehicle #2 usage
-v2t = pn.widgets.Select(name='Vehicle #2 Type',options=cf.veh_list,value='SUV-Compact-ICE')
-v2m = pn.widgets.IntSlider(name="Annual Mileage",value=0,start=0,end=30000,step=1000)
-v2h = pn.widgets.IntSlider(name='% Highway Driving',value=50,start=0,end=100,step=5)
-
-# widgets to specify vehicle #3 usage
-v3t = pn.widgets.Select(name='Vehicle #3 Type',options=cf.veh_list,value='SUV-Compact-ICE')
-v3m = pn.widgets.IntSlider(name="Annual Mileage",value=0,start=0,end=30000,step=1000)
-v3h = pn.widgets.IntSlider(name='% Highway Driving',value=50,start=0,end=100,step=5)
-
-# widgets to specify vehicle #4 usage
-v4t = pn.widgets.Select(name='Vehicle #4 Type',options=cf.veh_list,value='SUV-Compact-ICE')
-v4m = pn.widgets.IntSlider(name="Annual Mileage",value=0,start=0,end=30000,step=1000)
-v4h = pn.widgets.IntSlider(name='% Highway Driving',value=50,start=0,end=100,step=5)
-
-# widgets to specify public transportation usage
-ptm = pn.widgets.IntSlider(name="Bus/Train Annual Rider Mileage",value=0,start=0,end=20000,step=500)
-ptc = pn.bind(cf.convert,ptm,cf.pubtrans_co2_coeff,cf.year_to_week)      # direct emissions co2
-ptk1 = pn.bind(cf.convert,ptm,1/cf.pubtrans_fe,cf.year_to_week)          # fuel consumption, gal
-ptk2 = pn.bind(cf.convert,ptk1,cf.petrol_kwh_coeff)                   # equivalent kwh
-pt_text1a = pn.widgets.StaticText(name = "Public Transit weekly fuel (gal)",value=ptk1)
-pt_text1b = pn.widgets.StaticText(name = "Public Transit weekly energy (kWh)",value=ptk2)
-pt_text2 = pn.widgets.StaticText(name = "Public Transit weekly emissions (kg CO2)",value=ptc)
-
-# widgets to specify air travel usage
-ath = pn.widgets.IntSlider(name="Air Travel Annual Flight Hours",value=0,start=0,end=200,step=10)
-atc = pn.bind(cf.convert,ath,cf.air_co2_coeff,cf.year_to_week)      # direct emissions co2
-atk1 = pn.bind(cf.convert,ath,cf.air_fe_rate,cf.year_to_week)          # fuel consumption, gal
-atk2 = pn.bind(cf.convert,atk1,cf.petrol_kwh_coeff)                   # equivalent kwh
-at_text1a = pn.widgets.StaticText(name = "Air Travel weekly fuel (gal)",value=atk1)
-at_text1b = pn.widgets.StaticText(name = "Air Travel weekly energy (kWh)",value=atk2)
-at_text2 = pn.widgets.StaticText(name = "Air Travel weekly emissions (kg CO2)",value=atc) 
-
-##### Section 2 - Household #################################
-
-# bind the coefficient output to the lookup function and input
-ZIP_coeff = pn.bind(cf.coeff_lookup,cf.grid_coeff_data,ZIP_entry)
-# create a pretty text widget to show the grid coefficient
-ZIP_text = pn.widgets.StaticText(name = "Local kg-CO2/kWh Coefficient",value=ZIP_coeff)
-
-# widget to enter monthly energy usage
-hhe = pn.widgets.IntSlider(name="Monthly Home Electric Usage (kWh)",value=0,start=0,end=2000,step=50)
-# calculate usage
-hhelectric_co2 = pn.bind(cf.convert,hhe,ZIP_coeff,12/52)
-hhelectric_kwh = pn.bind(cf.convert,hhe,12/52)
-
-# widget to enter monthly natural gas usage
-hhn = pn.widgets.IntSlider(name="Monthly Home Natural Gas Usage (ccf)",value=0,start=0,end=200,step=5)
-# calculate usage
-hhnatgas_co2 = pn.bind(cf.convert,hhn,cf.natgas_co2_coeff,12/52)
-hhnatgas_kwh = pn.bind(cf.convert,hhn,cf.natgas_kwh_coeff,12/52)
-
-# create pretty text widgets to show the vehicle coefficients
-hh_text1 = pn.widgets.StaticText(name = "HH weekly electric (kg CO2)",value=hhelectric_co2)
-hh_text2 = pn.widgets.StaticText(name = "HH weekly electric (kWh)",value=hhelectric_kwh)
-hh_text3 = pn.widgets.StaticText(name = "HH weekly natural gas emissions (kg CO2)",value=hhnatgas_co2)
-hh_text4 = pn.widgets.StaticText(name = "HH weekly natural gas power (kWh)",value=hhnatgas_kwh)
-
-# widget to enter household population
-hh_pop = pn.widgets.IntSlider(name="Number of Adults living in home",value=1,start=1,end=10,step=1)
-
-# widget to enter daily diet (in calories) per adult
-hhd = pn.widgets.IntSlider(name="Daily Calorie Intake (per adult)",value=0,start=1000,end=5000,step=250)
-
-# widget to enter daily diet type
-hhdt = pn.widgets.IntSlider(name="Diet Type",value=4,start=1,end=6,step=1)
-
-# calculate usage
-# retrieve the dietary coefficient
-# then multiply by the num of calories and convert from daily to weekhly
-hhdiet_co2_coeff = pn.bind(cf.list_lookup,cf.diet_co2_eq,hhdt)
-hhdiet_prod_coeff = pn.bind(cf.list_lookup,cf.diet_prod_mult,hhdt)
-hhdiet_co2 = pn.bind(cf.convert,hhd,hhdiet_co2_coeff,0.001*7)
-hhdiet_kwh = pn.bind(cf.convert,hhd,hhdiet_prod_coeff,cf.diet_kcal_to_kwh*7)
-
-# create pretty text widgets to show the vehicle coefficients
-hh_text5 = pn.widgets.StaticText(name = "HH weekly diet (kg CO2)",value=hhdiet_co2)
-hh_text6 = pn.widgets.StaticText(name = "HH weekly diet (kWh)",value=hhdiet_kwh)
-
-# create a plot of the total energy consumption
-fig = pn.bind(cf.plot_usage_2,
-            v1t,v1h,v1m,
-            v2t,v2h,v2m,
-            v3t,v3h,v3m,
-            v4t,v4h,v4m,
-            ptm,ath,
-            hhe,hhn,hh_pop,
-            hhd,hhdt
-            )
-
-# create a plot of the total energy consumption
-fig2 = pn.bind(cf.plot_co2,
-            v1t,v1h,v1m,
-            v2t,v2h,v2m,
-            v3t,v3h,v3m,
-            v4t,v4h,v4m,
-            ptm,ath,
-            hhe,hhn,
-            ZIP_entry,
-            hh_pop,
-            hhd,hhdt
-            )
-
-# create layout for the worksheets
-pn.Tabs(
-    pn.Row(
-        pn.layout.Spacer(width=50),        
-        pn.Column(
-            '## Personal Vehicles',
-            v1t,v1h,v1m,
-            fuel_text1a,fuel_text1b,co2_text1,
-            pn.layout.Spacer(height=30),
-            v2t,v2h,v2m,
-            pn.layout.Spacer(height=30),
-            v3t,v3h,v3m,
-            pn.layout.Spacer(height=30),            
-            styles={'background': 'black'}
-        ),
-        pn.layout.Spacer(width=50),        
-        pn.Column(
-            '## Mass Transit',
-            ptm,
-            pt_text1a,pt_text1b,pt_text2,
-            pn.layout.Spacer(height=30),
-            ath,
-            at_text1a,at_text1b,at_text2,
-            pn.layout.Spacer(height=30),
-            styles={'background': 'black'}
-        ),
-        pn.layout.Spacer(width=50),        
-        pn.Column(
-            '## Your Results',
-            fig,
-            styles={'background': 'black'}
-        ),
-        pn.layout.Spacer(width=50),        
-        dynamic = True,styles={'background': 'black'},
-        name = 'Transportation'
-    ),
-    pn.Row(
-        pn.layout.Spacer(width=50),
-        pn.Column(
-            '## Household',
-            ZIP_entry,ZIP_text,
-            pn.layout.Spacer(height=30),
-            hh_pop,
-            pn.layout.Spacer(height=30),
-            hhe,hh_text2,hh_text1,
-            hhn,hh_text4,hh_text3,
-            pn.layout.Spacer(height=30),
-            hhd,hhdt,
-            '1-Vegan,2-Veget.,3-Pesc.,4-Omniv.,5-Paleo,6-Keto',
-            hh_text6,hh_text5,
-            pn.layout.Spacer(height=30),            
-            styles={'background': 'black'}
+# one browser session of the dashboard
+#   layout is the servable Tabs, inputs the widgets feeding the footprint besides the
+#   vehicle rows (in Household.from_key order), and widgets the session's widgets, vehicle
+#   rows and charts by name
+class DashboardSession:
+
+    def __init__(self,layout,inputs,updater,widgets):
+        self.layout = layout
+        self.inputs = inputs
+        self.updater = updater
+        self.widgets = widgets
+
+# function to build a fresh set of widgets, charts and callbacks for one session
+#   every session gets its own widgets; the lookup tables and result caches in
+#   Climate_fx are shared, read-only, by all sessions in the process
+def create_session():
+
+    # widget to input ZIP code and get coefficient
+    ZIP_entry = pn.widgets.IntInput(name="ZIP Code",
+                                    value=43017,width=intwidth,
+                                    styles={'color':textcolor})
+
+    ##### Section 1 - Vehicles #################################
+
+    # rows of widgets to specify each vehicle's usage, with buttons to add and remove vehicles
+    vehicles = ui.VehicleList([('SUV-Compact-ICE',50,0)]*3)
+
+    # widgets to specify public transportation usage
+    ptm = pn.widgets.IntSlider(name="Bus/Train Annual Rider Mileage",value=0,start=0,end=20000,step=500)
+    pt_text1a = pn.widgets.StaticText(name = "Public Transit weekly fuel (gal)")
+    pt_text1b = pn.widgets.StaticText(name = "Public Transit weekly energy (kWh)")
+    pt_text2 = pn.widgets.StaticText(name = "Public Transit weekly emissions (kg CO2)")
+
+    # widgets to specify air travel usage
+    ath = pn.widgets.IntSlider(name="Air Travel Annual Flight Hours",value=0,start=0,end=200,step=10)
+    at_text1a = pn.widgets.StaticText(name = "Air Travel weekly fuel (gal)")
+    at_text1b = pn.widgets.StaticText(name = "Air Travel weekly energy (kWh)")
+    at_text2 = pn.widgets.StaticText(name = "Air Travel weekly emissions (kg CO2)")
+
+    ##### Section 2 - Household #################################
+
+    # create a pretty text widget to show the grid coefficient
+    ZIP_text = pn.widgets.StaticText(name = "Local kg-CO2/kWh Coefficient")
+
+    # widget to enter monthly energy usage
+    hhe = pn.widgets.IntSlider(name="Monthly Home Electric Usage (kWh)",value=0,start=0,end=2000,step=50)
+
+    # widget to enter monthly natural gas usage
+    hhn = pn.widgets.IntSlider(name="Monthly Home Natural Gas Usage (ccf)",value=0,start=0,end=200,step=5)
+
+    # widget to upload utility bill exports (electric CSV/xlsx, gas CSV)
+    bill_files = pn.widgets.FileInput(accept='.csv,.xlsx',multiple=True)
+
+    # create a pretty text widget to show the heating model fitted from the gas bills
+    heating_text = pn.widgets.StaticText(name = "Natural gas model (typical weather)")
+
+    # weekly history of the uploaded bills, kept for the session
+    history = ch.HistoryStore()
+    history_chart = ui.HistoryChart()
+
+    # fill the monthly usage sliders from the average of the uploaded bills
+    #   and add any new billing periods to the history
+    @metrics.timed('dashboard.load_bills')
+    def load_bills(value):
+        if not value:
+            return
+        periods = bills.merge_bills(*(bills.read_bills(data,name) for name,data in zip(bill_files.filename,value)))
+        usage = bills.average_monthly_usage(periods)
+        if history.append(periods):
+            history_chart.update(history,ZIP_entry.value,hh_pop.value)
+        # gas bills with temperatures give the typical-year use from the heating model
+        fit = heating.fit_periods(periods)
+        fitted = fit.periods > 0
+        if fitted.any():
+            usage['gas'] = fit.monthly_ccf[fitted].sum()
+            heating_text.value = '%.2f ccf/day + %.3f ccf per heating degree day (R² %.2f)' % (
+                fit.baseload[fitted].sum(),fit.slope[fitted].sum(),fit.r2[fitted].min())
+        if usage['electric']:
+            ui.set_slider(hhe,usage['electric'])
+        if usage['gas']:
+            ui.set_slider(hhn,usage['gas'])
+
+    pn.bind(load_bills,bill_files,watch=True)
+
+    # create pretty text widgets to show the household usage
+    hh_text1 = pn.widgets.StaticText(name = "HH weekly electric (kg CO2)")
+    hh_text2 = pn.widgets.StaticText(name = "HH weekly electric (kWh)")
+    hh_text3 = pn.widgets.StaticText(name = "HH weekly natural gas emissions (kg CO2)")
+    hh_text4 = pn.widgets.StaticText(name = "HH weekly natural gas power (kWh)")
+
+    # widget to enter household population
+    hh_pop = pn.widgets.IntSlider(name="Number of Adults living in home",value=1,start=1,end=10,step=1)
+
+    # widget to enter daily diet (in calories) per adult
+    hhd = pn.widgets.IntSlider(name="Daily Calorie Intake (per adult)",value=0,start=1000,end=5000,step=250)
+
+    # widget to enter daily diet type
+    hhdt = pn.widgets.IntSlider(name="Diet Type",value=4,start=1,end=6,step=1)
+
+    # create pretty text widgets to show the diet impact
+    hh_text5 = pn.widgets.StaticText(name = "HH weekly diet (kg CO2)")
+    hh_text6 = pn.widgets.StaticText(name = "HH weekly diet (kWh)")
+
+    ##### Results #################################
+
+    # charts are created once per session and updated in place
+    #   the power chart is shown on every tab, so each tab gets its own copy
+    power_charts = [ui.power_chart() for i in range(3)]
+    co2_chart = ui.emissions_chart()
+
+    # render both charts and all readouts from one footprint
+    @metrics.timed('dashboard.show_results')
+    def show_results(fp):
+        for chart in power_charts:
+            chart.update(fp.watts)
+        co2_chart.update(fp.co2)
+        hh = fp.household
+        vehicles.show(fp)
+        pt_text1a.value = round(hh['gal']['Public Transit'],1)
+        pt_text1b.value = round(hh['kwh']['Public Transit'],1)
+        pt_text2.value = round(hh['co2']['Public Transit'],1)
+        at_text1a.value = round(hh['gal']['Air Travel'],1)
+        at_text1b.value = round(hh['kwh']['Air Travel'],1)
+        at_text2.value = round(hh['co2']['Air Travel'],1)
+        ZIP_text.value = fp.zipcoeff
+        hh_text1.value = round(hh['co2']['HH Elec Grid'],1)
+        hh_text2.value = round(hh['kwh']['HH Elec Grid'],1)
+        hh_text3.value = round(hh['co2']['HH NatGas Usage'],1)
+        hh_text4.value = round(hh['kwh']['HH NatGas Usage'],1)
+        hh_text5.value = round(hh['co2']['HH Diet Impact'],1)
+        hh_text6.value = round(hh['kwh']['HH Diet Impact'],1)
+        share.update(fp)
+
+    # the history follows the ZIP code and household size
+    def show_history(*events):
+        if len(history):
+            history_chart.update(history,ZIP_entry.value,hh_pop.value)
+    ZIP_entry.param.watch(show_history,'value')
+    hh_pop.param.watch(show_history,'value_throttled')
+
+    # national grid coefficient view, moved to the entered ZIP code
+    grid_view = ui.GridCoeffView()
+    ZIP_entry.param.watch(lambda event: grid_view.update(event.new),'value')
+    grid_view.update(ZIP_entry.value)
+
+    inputs = [ptm,ath,
+              hhe,hhn,
+              ZIP_entry,
+              hh_pop,
+              hhd,hhdt]
+
+    # the household described by the inputs
+    def household():
+        return cf.Household(vehicles.values(),
+                            [('transit',ptm.value),('air',ath.value)],
+                            [('electric',hhe.value),('gas',hhn.value)],
+                            ZIP_entry.value,hh_pop.value,hhd.value,hhdt.value)
+
+    # set the inputs to a household, its trips and energy totalled per mode / kind
+    def set_household(hh):
+        vehicles.set(hh.vehicles)
+        key = hh.key
+        for w,value in zip(inputs,key[1:]):
+            if w.value != value:
+                ui.set_input(w,value)
+
+    # a session opened from a share link starts in the linked state, and the page URL
+    # follows the shown results
+    share = ui.ShareLink(household,set_household)
+
+    # recompute following the central update policy (throttled and coalesced while dragging)
+    #   the footprint (cached per input state) is computed off the event loop in a server session;
+    #   vehicle rows added or removed are watched / unwatched as they come and go
+    updater = ui.ThrottledUpdater(show_results,vehicles.inputs() + inputs,compute=cf.cached_footprint,
+                                  state=lambda: [household()])
+    vehicles.follow(updater)
+    show_results(cf.cached_footprint(household()))
+
+    # create layout for the worksheets
+    layout = pn.Tabs(
+        pn.Row(
+            pn.layout.Spacer(width=50),        
+            pn.Column(
+                '## Personal Vehicles',
+                vehicles.pane,
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),        
+            pn.Column(
+                '## Mass Transit',
+                ptm,
+                pt_text1a,pt_text1b,pt_text2,
+                pn.layout.Spacer(height=30),
+                ath,
+                at_text1a,at_text1b,at_text2,
+                pn.layout.Spacer(height=30),
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),        
+            pn.Column(
+                '## Your Results',
+                power_charts[0].pane,
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),        
+            dynamic = True,styles={'background': 'black'},
+            name = 'Transportation'
         ),
-        pn.layout.Spacer(width=50),        
+        pn.Row(
+            pn.layout.Spacer(width=50),
             pn.Column(
-            '## Your Results',
-            fig,
-            styles={'background': 'black'}
+                '## Household',
+                ZIP_entry,ZIP_text,
+                pn.layout.Spacer(height=30),
+                hh_pop,
+                pn.layout.Spacer(height=30),
+                'Load utility bill exports to fill in monthly usage',
+                bill_files,
+                hhe,hh_text2,hh_text1,
+                hhn,heating_text,hh_text4,hh_text3,
+                pn.layout.Spacer(height=30),
+                hhd,hhdt,
+                '1-Vegan,2-Veget.,3-Pesc.,4-Omniv.,5-Paleo,6-Keto',
+                hh_text6,hh_text5,
+                pn.layout.Spacer(height=30),            
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),        
+                pn.Column(
+                '## Your Results',
+                power_charts[1].pane,
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),        
+            dynamic = True,styles={'background': 'black'},
+            name = 'Household'        
         ),
-        pn.layout.Spacer(width=50),        
-        dynamic = True,styles={'background': 'black'},
-        name = 'Household'        
-    ),
-    pn.Row(
-        pn.layout.Spacer(width=50),
-        pn.Column(
-            '## Your Results: Power',
-            fig,
-            styles={'background': 'black'}
+        pn.Row(
+            pn.layout.Spacer(width=50),
+            pn.Column(
+                '## Your Results: Power',
+                power_charts[2].pane,
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),        
+            pn.Column(
+                '## Your Results: Emissions',
+                co2_chart.pane,
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),        
+            dynamic = True,styles={'background': 'black'},
+            name = 'Results'        
         ),
-        pn.layout.Spacer(width=50),        
-        pn.Column(
-            '## Your Results: Emissions',
-            fig2,
-            styles={'background': 'black'}
+        pn.Row(
+            pn.layout.Spacer(width=50),
+            pn.Column(
+                '## Grid Coefficients',
+                grid_view.pane,
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),
+            dynamic = True,styles={'background': 'black'},
+            name = 'Grid'
         ),
-        pn.layout.Spacer(width=50),        
-        dynamic = True,styles={'background': 'black'},
-        name = 'Results'        
+        pn.Row(
+            pn.layout.Spacer(width=50),
+            pn.Column(
+                '## Household Energy History',
+                'Load utility bill exports on the Household tab to chart them week by week',
+                history_chart.pane,
+                styles={'background': 'black'}
+            ),
+            pn.layout.Spacer(width=50),
+            dynamic = True,styles={'background': 'black'},
+            name = 'History'
+        )
     )
-).servable()
\ No newline at end of file
+
+    widgets = {'ZIP_entry':ZIP_entry,'ZIP_text':ZIP_text,
+               'vehicles':vehicles,
+               'ptm':ptm,'pt_text1a':pt_text1a,'pt_text1b':pt_text1b,'pt_text2':pt_text2,
+               'ath':ath,'at_text1a':at_text1a,'at_text1b':at_text1b,'at_text2':at_text2,
+               'hhe':hhe,'hhn':hhn,'bill_files':bill_files,'heating_text':heating_text,
+               'hh_text1':hh_text1,'hh_text2':hh_text2,'hh_text3':hh_text3,'hh_text4':hh_text4,
+               'hh_pop':hh_pop,'hhd':hhd,'hhdt':hhdt,'hh_text5':hh_text5,'hh_text6':hh_text6,
+               'power_charts':power_charts,'co2_chart':co2_chart,
+               'grid_view':grid_view,'history_chart':history_chart}
+    return DashboardSession(layout,inputs,updater,widgets)
+
+# function to return the servable layout for a new session, as used by pn.serve
+#   also starts this process's metrics endpoint / log dump when metrics are switched on
+def create_app():
+    metrics.start()
+    metrics.increment('dashboard.sessions')
+    return create_session().layout
+
+
+# panel serve ClimateDash.py runs this script once per session
+if __name__.startswith('bokeh'):
+    create_app().servable()
+
+# python ClimateDash.py [--port N] [--num-procs N] starts a server with the app factory
+#   the lookup tables are loaded before the server forks, and the ZIP index is a
+#   read-only memory map, so every process shares one copy of the data pages
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the climate dashboard')
+    parser.add_argument('--port',type=int,default=5006)
+    parser.add_argument('--address',default=None)
+    parser.add_argument('--num-procs',type=int,default=1,help='server processes (0 = one per CPU)')
+    parser.add_argument('--allow-websocket-origin',action='append',dest='origins')
+    parser.add_argument('--results',default=os.environ.get('CLIMATEDASH_RESULTS','results.sqlite'),
+                        help="SQLite file keeping computed footprints across sessions and restarts ('' = off)")
+    args = parser.parse_args()
+    os.environ['CLIMATEDASH_RESULTS'] = args.results
+    cf.load_tables()
+    pn.serve({'ClimateDash':create_app},port=args.port,address=args.address,
+             num_procs=args.num_procs,websocket_origin=args.origins,show=False)
@@ -0,0 +1,140 @@
+# Climate Dashboard bulk scoring
+#   runs the dashboard footprint model over tables of households
+#
+#   input columns (missing columns take the defaults below):
+#     v1_type, v1_hwy, v1_miles, v2_type, ...   any number of vehicles, 'Vehicle Type' names
+#     transit_miles, flight_hours               annual public transit miles and flight hours
+#     elec_kwh, gas_ccf                         monthly household electric and natural gas
+#     zip, pop, calories, diet_type             ZIP code, adults, daily calories, diet type 1-6
+#   output columns, all weekly: <category>_W and <category>_kgco2 per HH member, plus totals
+#
+#   usage: python Climate_batch.py households.csv scores.csv [--chunksize N]
+
+import argparse
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+import Climate_fx as cf
+
+# defaults for household columns that are absent or blank
+household_defaults = {'transit_miles':0,
+                      'flight_hours':0,
+                      'elec_kwh':0,
+                      'gas_ccf':0,
+                      'zip':0,
+                      'pop':2,
+                      'calories':2000,
+                      'diet_type':4}
+
+# output column prefix for each footprint category
+category_columns = {'EV Grid':'ev_grid',
+                    'ICE Fuel Usage':'ice_fuel',
+                    'Public Transit':'transit',
+                    'Air Travel':'air',
+                    'HH Elec Grid':'hh_elec',
+                    'HH NatGas Usage':'hh_natgas',
+                    'HH Diet Impact':'diet'}
+
+# default number of rows scored at a time when streaming a CSV
+default_chunksize = 100000
+
+
+# function to return the vehicle numbers present in a household table (v1_type -> 1, ...)
+def vehicle_slots(columns):
+    slots = [int(m.group(1)) for m in (re.fullmatch(r'v(\d+)_type',c) for c in columns) if m]
+    return sorted(slots)
+
+# function to return a numeric column, filling gaps with a default
+def numeric_column(households,name,default):
+    if name not in households:
+        return np.full(len(households),default,dtype=np.float64)
+    return pd.to_numeric(households[name],errors='coerce').fillna(default).to_numpy(np.float64)
+
+# function to return the diet_type column as dashboard diet types 1-6
+#   blank cells take the default, anything else that is not a whole number 1-6 raises ValueError
+def diet_column(households,default=household_defaults['diet_type']):
+    if 'diet_type' not in households:
+        return np.full(len(households),default,dtype=np.int64)
+    types = households['diet_type']
+    values = pd.to_numeric(types,errors='coerce').to_numpy(np.float64)
+    blank = types.isna().to_numpy() | (types.astype(str).str.strip() == '').to_numpy()
+    invalid = ~blank & ~np.isin(values,np.arange(1,len(cf.diet_names) + 1))
+    if invalid.any():
+        bad = sorted(set(types[invalid].astype(str)))
+        raise ValueError('invalid diet types in diet_type (whole numbers 1-%d): %s' % (len(cf.diet_names),', '.join(bad)))
+    return np.where(blank,default,values).astype(np.int64)
+
+# function to convert the vehicle columns into (N,V) catalog rows, mileage and % highway
+#   blank vehicle types contribute no mileage, unknown types raise ValueError
+def vehicle_arrays(households):
+    slots = vehicle_slots(households.columns) or [1]
+    n = len(households)
+    idx = np.zeros((n,len(slots)),dtype=np.intp)
+    miles = np.zeros((n,len(slots)))
+    hwy = np.zeros((n,len(slots)))
+    for j,slot in enumerate(slots):
+        types = households.get('v%d_type' % slot)
+        if types is None:
+            continue
+        codes = pd.Categorical(types,categories=cf.veh_catalog.models).codes
+        unknown = (codes < 0) & types.notna().to_numpy()
+        if unknown.any():
+            bad = sorted(set(types[unknown].astype(str)))
+            raise ValueError('unknown vehicle types in v%d_type: %s' % (slot,', '.join(bad)))
+        idx[:,j] = np.maximum(codes,0)
+        miles[:,j] = np.where(codes >= 0,numeric_column(households,'v%d_miles' % slot,0),0)
+        hwy[:,j] = numeric_column(households,'v%d_hwy' % slot,50)
+    return idx, miles, hwy
+
+# function to score a DataFrame of households
+#   returns a DataFrame with the same index holding per-category and total
+#   weekly watts and kg-CO2 per HH member, identical to the dashboard charts
+def score_households(households):
+    col = {k:numeric_column(households,k,v) for k,v in household_defaults.items()}
+    idx, miles, hwy = vehicle_arrays(households)
+    res = cf.footprint_arrays(idx,miles,hwy,
+                              col['transit_miles'],col['flight_hours'],
+                              col['elec_kwh'],col['gas_ccf'],
+                              cf.coeff_lookup_many(cf.grid_coeff_index,col['zip']),
+                              col['pop'],col['calories'],diet_column(households))
+    out = {}
+    for c,name in category_columns.items():
+        out[name + '_W'] = res['watts'][c]
+        out[name + '_kgco2'] = res['co2'][c]
+    out['total_W'] = sum(res['watts'].values())
+    out['total_kgco2'] = sum(res['co2'].values())
+    return pd.DataFrame(out,index=households.index)
+
+# function to score a CSV of households in chunks so memory stays bounded
+#   writes the input columns followed by the score columns to dst, returns the row count
+def score_csv(src,dst,chunksize=default_chunksize,keep_inputs=True):
+    rows = 0
+    first = True
+    for chunk in pd.read_csv(src,chunksize=chunksize):
+        scores = score_households(chunk)
+        if keep_inputs:
+            scores = pd.concat([chunk,scores],axis=1)
+        scores.to_csv(dst,mode='w' if first else 'a',header=first,index=False)
+        first = False
+        rows += len(chunk)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a CSV of households with the ClimateDash footprint model')
+    parser.add_argument('src',help='household CSV, or - for stdin')
+    parser.add_argument('dst',help='output CSV, or - for stdout')
+    parser.add_argument('--chunksize',type=int,default=default_chunksize,help='rows scored at a time')
+    parser.add_argument('--scores-only',action='store_true',help='omit the input columns from the output')
+    args = parser.parse_args(argv)
+    src = sys.stdin if args.src == '-' else args.src
+    dst = sys.stdout if args.dst == '-' else args.dst
+    rows = score_csv(src,dst,args.chunksize,keep_inputs=not args.scores_only)
+    print('scored %d households' % rows,file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+# Climate Dashboard benchmark suite
+#   times the lookups, footprint math, chart rendering, data loading, import,
+#   dashboard round trip and bulk scoring on fixed synthetic inputs (no network needed)
+#   and saves the results as JSON so runs can be compared across commits
+#
+#   usage: python Climate_bench.py [--quick] [--output FILE] [--compare OLD.json]
+#     --quick      skips the 1M-household bulk run and shortens the repeats
+#     --output     defaults to benchmarks/<git commit>.json
+#     --compare    prints the change against an earlier results file
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import Climate_fx as cf
+from Climate_cache import default_cache_size
+
+# cold import budget for Climate_fx in seconds, see README
+import_time_target = 0.150
+
+# seed for every synthetic input, so runs are comparable
+bench_seed = 2023
+
+
+# function to time fn() and summarize the per-call latency in milliseconds
+#   number calls are timed together per sample to resolve very fast functions
+def timeit(fn,repeat=20,number=1):
+    fn()
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    samples.sort()
+    return {'repeat':repeat,
+            'number':number,
+            'mean_ms':statistics.fmean(samples),
+            'p50_ms':samples[len(samples)//2],
+            'p95_ms':samples[min(len(samples)-1,int(len(samples)*0.95))],
+            'min_ms':samples[0]}
+
+# function to run fn() once under tracemalloc and return its result, seconds and peak MB
+def measure_peak(fn):
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2**20
+
+# function to return random dashboard inputs in the widget ranges
+def random_inputs(rng,n):
+    models = cf.vehicle_catalog().models
+    zips = rng.integers(0,100000,n)
+    states = []
+    for i in range(n):
+        args = []
+        for v in range(4):
+            args += [models[rng.integers(len(models))],int(rng.integers(0,21))*5,int(rng.integers(0,31))*1000]
+        args += [int(rng.integers(0,41))*500,int(rng.integers(0,21))*10,
+                 int(rng.integers(0,41))*50,int(rng.integers(0,41))*5,int(zips[i]),
+                 int(rng.integers(1,11)),int(rng.integers(4,21))*250,int(rng.integers(1,7))]
+        states.append(args)
+    return states
+
+# function to return a synthetic household table for the bulk scoring API
+def random_households(rng,n):
+    import pandas as pd
+    models = np.array(cf.vehicle_catalog().models)
+    data = {}
+    for v in range(1,5):
+        data['v%d_type' % v] = models[rng.integers(len(models),size=n)]
+        data['v%d_hwy' % v] = rng.integers(0,21,n)*5
+        data['v%d_miles' % v] = rng.integers(0,31,n)*1000
+    data.update({'transit_miles':rng.integers(0,41,n)*500,
+                 'flight_hours':rng.integers(0,21,n)*10,
+                 'elec_kwh':rng.integers(0,41,n)*50,
+                 'gas_ccf':rng.integers(0,41,n)*5,
+                 'zip':rng.integers(0,100000,n),
+                 'pop':rng.integers(1,11,n),
+                 'calories':rng.integers(4,21,n)*250,
+                 'diet_type':rng.integers(1,7,n)})
+    return pd.DataFrame(data)
+
+
+def bench_lookups(results,quick):
+    rng = np.random.default_rng(bench_seed)
+    index = cf.zip_index()
+    zips = rng.integers(0,100000,10000)
+    it = iter(np.tile(zips,1000))
+    results['coeff_lookup'] = timeit(lambda: cf.coeff_lookup(index,next(it)),number=1000)
+    results['coeff_lookup_many_100k'] = timeit(lambda: cf.coeff_lookup_many(index,zips.repeat(10)),
+                                               repeat=5 if quick else 20)
+    catalog = cf.vehicle_catalog()
+    models = [catalog.models[i] for i in rng.integers(len(catalog),size=10000)]
+    it = iter(models*1000)
+    results['get_veh_usage'] = timeit(lambda: cf.get_veh_usage(catalog,next(it),12000,50,retval='co2',zip=43017),
+                                      number=1000)
+
+# plot_usage_2 takes the plot_co2 arguments with the ZIP code moved last
+def usage_args(state):
+    return state[:16] + state[17:] + state[16:17]
+
+def bench_charts(results,quick):
+    rng = np.random.default_rng(bench_seed)
+    states = iter(random_inputs(rng,1000))
+    cf.set_cache_size(0)
+    try:
+        results['compute_footprint'] = timeit(lambda: cf.compute_footprint(*next(states)),number=20)
+        results['plot_usage_2_cold'] = timeit(lambda: cf.plot_usage_2(*usage_args(next(states))),
+                                              repeat=5 if quick else 20)
+        results['plot_co2_cold'] = timeit(lambda: cf.plot_co2(*next(states)),repeat=5 if quick else 20)
+    finally:
+        cf.set_cache_size(default_cache_size)
+    state = next(states)
+    results['plot_co2_cached'] = timeit(lambda: cf.plot_co2(*state),number=100)
+
+def bench_loading(results,quick):
+    import Climate_data
+    results['read_zip_csv'] = timeit(lambda: Climate_data.read_zip_csv(),repeat=3 if quick else 10)
+    results['load_zip_index'] = timeit(lambda: Climate_data.load_zip_index(rebuild=False),repeat=3 if quick else 10)
+    results['vehicle_catalog_csv'] = timeit(lambda: Climate_data.VehicleCatalog.from_csv(),repeat=10)
+    try:
+        import pandas as pd
+    except ImportError:
+        return
+    results['pandas_read_zip_csv'] = timeit(lambda: pd.read_csv(Climate_data.zip_csv_file),repeat=3 if quick else 10)
+
+def bench_import(results,quick):
+    samples = []
+    for i in range(3 if quick else 10):
+        out = subprocess.run([sys.executable,'-c',
+                              'import time; t=time.perf_counter(); import Climate_fx; print(time.perf_counter()-t)'],
+                             capture_output=True,text=True,check=True,cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(float(out.stdout.strip()))
+    samples.sort()
+    results['import_Climate_fx'] = {'repeat':len(samples),
+                                    'p50_ms':samples[len(samples)//2]*1000,
+                                    'min_ms':samples[0]*1000,
+                                    'target_ms':import_time_target*1000,
+                                    'within_target':samples[len(samples)//2] <= import_time_target}
+
+# full widget change in ClimateDash.py: set a slider and let the bound callbacks run
+def bench_dashboard(results,quick):
+    try:
+        import panel
+    except ImportError:
+        results['dashboard_round_trip'] = {'skipped':'panel is not installed'}
+        return
+    namespace = {'__name__':'climate_bench'}
+    with open('ClimateDash.py') as f:
+        exec(compile(f.read(),'ClimateDash.py','exec'),namespace)
+    slider = namespace['create_session']().widgets['vehicles'].rows[0].miles
+    values = iter(list(range(0,30001,1000))*1000)
+    cf.set_cache_size(0)
+    try:
+        results['dashboard_round_trip'] = timeit(lambda: setattr(slider,'value',next(values)),
+                                                 repeat=5 if quick else 20)
+    finally:
+        cf.set_cache_size(default_cache_size)
+
+def bench_bulk(results,quick):
+    try:
+        import Climate_batch
+    except ImportError:
+        results['bulk'] = {'skipped':'pandas is not installed'}
+        return
+    rng = np.random.default_rng(bench_seed)
+    for n in (10000,100000) if quick else (10000,100000,1000000):
+        households = random_households(rng,n)
+        scores, seconds, peak = measure_peak(lambda: Climate_batch.score_households(households))
+        results['bulk_%d' % n] = {'households':n,
+                                  'seconds':seconds,
+                                  'households_per_s':n/seconds,
+                                  'peak_mb':peak}
+
+benchmarks = [bench_lookups,bench_charts,bench_loading,bench_import,bench_dashboard,bench_bulk]
+
+
+# function to run every benchmark and return the results document
+def run(quick=False):
+    results = {}
+    for bench in benchmarks:
+        print('running %s' % bench.__name__,file=sys.stderr)
+        bench(results,quick)
+    return {'commit':git_commit(),
+            'date':datetime.datetime.now().isoformat(timespec='seconds'),
+            'python':platform.python_version(),
+            'numpy':np.__version__,
+            'machine':platform.machine(),
+            'quick':quick,
+            'results':results}
+
+def git_commit():
+    try:
+        out = subprocess.run(['git','rev-parse','--short','HEAD'],capture_output=True,text=True,check=True)
+        return out.stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return 'unknown'
+
+# function to print the change of each headline figure against an earlier run
+def compare(old,new):
+    for name,result in new['results'].items():
+        before = old['results'].get(name,{})
+        for key in ('p50_ms','seconds'):
+            if key in result and key in before and before[key]:
+                print('%-28s %10.4f -> %10.4f  (%+.1f%%)' % (name,before[key],result[key],
+                                                            (result[key]/before[key] - 1)*100))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ClimateDash benchmark suite')
+    parser.add_argument('--quick',action='store_true',help='skip the 1M-household run and use fewer repeats')
+    parser.add_argument('--output',help='results JSON file (default benchmarks/<commit>.json)')
+    parser.add_argument('--compare',help='earlier results JSON file to compare against')
+    args = parser.parse_args(argv)
+    doc = run(args.quick)
+    output = args.output or os.path.join('benchmarks','%s.json' % doc['commit'])
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output),exist_ok=True)
+    with open(output,'w') as f:
+        json.dump(doc,f,indent=1)
+    print('saved %s' % output,file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f),doc)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# Climate Dashboard utility bill import
+#   streams the utility usage exports into normalized billing periods and
+#   average monthly usage for the household electric (kWh) and natural gas (ccf) inputs
+#
+#   supported exports:
+#     electric CSV   UsageHistory<account>_<date>.csv, account header block then
+#                    Date, Days per Billing Period, ..., Your Usage (KWH), ..., Amount, ...
+#     electric xlsx  the same table saved from Excel (needs openpyxl)
+#     gas CSV        GasUsage{Current,Previous}Year_<account>.csv with
+#                    Date, Type of Read, Avg Temp, Number of Days, Units Used, ..., Bill Amount, ...
+#
+#   usage: python Climate_bills.py <export> [<export> ...]
+
+import csv
+import datetime
+import io
+import os
+import re
+import sys
+from collections import namedtuple
+
+# one billing period from any export
+#   kind is 'electric' (usage in kWh) or 'gas' (usage in ccf), end is the read date
+#   amount is the bill in dollars, avg_temp the average temperature (gas only, else None)
+BillPeriod = namedtuple('BillPeriod',['account','kind','end','days','usage','amount','avg_temp'])
+
+bill_units = {'electric':'kWh','gas':'ccf'}
+
+# account of periods from an export with no account number in its header or file name
+#   (e.g. GasUsageCurrentYear_combined.csv); resolve_accounts gives them the account of
+#   the same kind from the other exports
+unnamed_account = ''
+
+days_per_month = 365/12
+
+# header cells that identify each export
+electric_columns = ('Date','Days per Billing Period','Your Usage (KWH)','Amount')
+gas_columns = ('Date','Avg Temp','Number of Days','Units Used','Bill Amount')
+
+
+# function to convert an export cell ("$1,234.50 ", "\"677\"", "20 %", 677) to a float
+#   returns None for blank cells
+def parse_number(value):
+    if value is None:
+        return None
+    if isinstance(value,(int,float)):
+        return float(value)
+    text = value.strip().replace('$','').replace(',','').replace('%','').strip()
+    if not text:
+        return None
+    return float(text)
+
+# function to convert an export date cell (M/D/YYYY text or a spreadsheet datetime) to a date
+def parse_date(value):
+    if isinstance(value,datetime.datetime):
+        return value.date()
+    if isinstance(value,datetime.date):
+        return value
+    return datetime.datetime.strptime(value.strip(),'%m/%d/%Y').date()
+
+# function to read the account number from an export file name, unnamed_account if it has none
+def account_from_name(name):
+    stem = os.path.splitext(os.path.basename(name or ''))[0]
+    m = re.search(r'UsageHistory(\d+)',stem) or re.search(r'Year_(\d+)$',stem)
+    return m.group(1) if m else unnamed_account
+
+# function to turn the rows of any export into billing periods
+#   rows is an iterator of cell lists; the header block before the table is skipped,
+#   reading stops at the 'Total:' row
+def parse_rows(rows,name=None):
+    account = account_from_name(name)
+    rows = iter(rows)
+    for row in rows:
+        cells = [c.strip() if isinstance(c,str) else c for c in row]
+        if not cells or cells[0] is None:
+            continue
+        if cells[0] == 'Account Number' and len(cells) > 1 and cells[1]:
+            account = str(cells[1])
+        if all(c in cells for c in electric_columns):
+            kind, columns = 'electric', electric_columns
+            break
+        if all(c in cells for c in gas_columns):
+            kind, columns = 'gas', gas_columns
+            break
+    else:
+        return
+    col = {c:cells.index(c) for c in columns}
+    for row in rows:
+        if not row or row[0] is None or row[0] == '':
+            continue
+        if isinstance(row[0],str) and row[0].strip().startswith('Total'):
+            break
+        if kind == 'electric':
+            yield BillPeriod(account,kind,parse_date(row[col['Date']]),
+                             int(parse_number(row[col['Days per Billing Period']])),
+                             parse_number(row[col['Your Usage (KWH)']]),
+                             parse_number(row[col['Amount']]),None)
+        else:
+            yield BillPeriod(account,kind,parse_date(row[col['Date']]),
+                             int(parse_number(row[col['Number of Days']])),
+                             parse_number(row[col['Units Used']]),
+                             parse_number(row[col['Bill Amount']]),
+                             parse_number(row[col['Avg Temp']]))
+
+# function to stream billing periods from a CSV export (path, bytes or text stream)
+def read_bill_csv(source,name=None):
+    if isinstance(source,bytes):
+        source = io.StringIO(source.decode('utf-8-sig'))
+    if isinstance(source,str):
+        with open(source,newline='',encoding='utf-8-sig') as f:
+            yield from parse_rows(csv.reader(f),name or source)
+    else:
+        yield from parse_rows(csv.reader(source),name)
+
+# function to stream billing periods from an Excel export (path, bytes or binary stream)
+def read_bill_xlsx(source,name=None):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError('reading .xlsx bills needs openpyxl: pip install openpyxl')
+    if isinstance(source,bytes):
+        source = io.BytesIO(source)
+    workbook = openpyxl.load_workbook(source,read_only=True,data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        yield from parse_rows(rows,name or (source if isinstance(source,str) else None))
+    finally:
+        workbook.close()
+
+# function to stream billing periods from any supported export, chosen by file extension
+def read_bills(source,name=None):
+    name = name or (source if isinstance(source,str) else '')
+    if name.lower().endswith(('.xlsx','.xlsm')):
+        return read_bill_xlsx(source,name)
+    return read_bill_csv(source,name)
+
+# function to give periods of unnamed exports the account of their kind, when there is one
+#   known holds (account, kind) pairs seen elsewhere, e.g. already stored; periods of a kind
+#   with no or several named accounts keep unnamed_account
+def resolve_accounts(periods,known=()):
+    periods = list(periods)
+    named = {}
+    for account,kind in list(known) + [(p.account,p.kind) for p in periods]:
+        if account != unnamed_account:
+            named.setdefault(kind,set()).add(account)
+    owner = {kind:accounts.pop() for kind,accounts in named.items() if len(accounts) == 1}
+    return [p._replace(account=owner[p.kind]) if p.account == unnamed_account and p.kind in owner else p
+            for p in periods]
+
+# function to merge billing periods from several exports
+#   periods with the same account, kind and read date are kept once, after unnamed exports
+#   take their kind's account (resolve_accounts); returns them sorted by account, kind and date
+def merge_bills(*sources,known=()):
+    periods = {}
+    for p in resolve_accounts((p for source in sources for p in source),known):
+        periods[(p.account,p.kind,p.end)] = p
+    return [periods[k] for k in sorted(periods)]
+
+# function to prorate billing periods onto calendar months
+#   returns {(account, kind, 'YYYY-MM'): usage}; each bill covers the days before its read date
+def monthly_usage(periods):
+    months = {}
+    for p in periods:
+        if not p.days or p.usage is None:
+            continue
+        rate = p.usage / p.days
+        day = p.end - datetime.timedelta(days=p.days)
+        while day < p.end:
+            next_month = (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+            span = (min(next_month,p.end) - day).days
+            key = (p.account,p.kind,day.strftime('%Y-%m'))
+            months[key] = months.get(key,0.0) + rate*span
+            day = next_month
+    return months
+
+# function to return average monthly usage per kind, summed over accounts
+#   {'electric': kWh / month, 'gas': ccf / month}, computed as total usage over total days
+#   so partial years and uneven billing periods are weighted correctly
+def average_monthly_usage(periods):
+    totals = {}
+    for p in periods:
+        if not p.days or p.usage is None:
+            continue
+        usage, days = totals.get((p.account,p.kind),(0.0,0))
+        totals[(p.account,p.kind)] = (usage + p.usage,days + p.days)
+    average = {kind:0.0 for kind in bill_units}
+    for (account,kind),(usage,days) in totals.items():
+        average[kind] += usage / days * days_per_month
+    return average
+
+# function to read any number of exports and return the average monthly usage
+#   sources are paths or (name, bytes) pairs, as uploaded through the dashboard
+def household_usage(*sources):
+    streams = []
+    for source in sources:
+        if isinstance(source,tuple):
+            streams.append(read_bills(source[1],source[0]))
+        else:
+            streams.append(read_bills(source))
+    return average_monthly_usage(merge_bills(*streams))
+
+
+if __name__ == '__main__':
+    periods = merge_bills(*(read_bills(path) for path in sys.argv[1:]))
+    for (account,kind,month),usage in sorted(monthly_usage(periods).items()):
+        print('%s,%s,%s,%.1f' % (account,kind,month,usage))
+    for kind,usage in average_monthly_usage(periods).items():
+        print('# average %s: %.1f %s / month' % (kind,usage,bill_units[kind]))
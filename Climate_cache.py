@@ -0,0 +1,82 @@
+# Climate Dashboard result caches
+#   bounded least-recently-used caches shared by every session in a process,
+#   so repeated input states skip the footprint math and chart construction
+
+import os
+import threading
+from collections import OrderedDict
+
+# default number of entries kept per cache, override with CLIMATEDASH_CACHE_SIZE
+default_cache_size = int(os.environ.get('CLIMATEDASH_CACHE_SIZE',1024))
+
+
+# thread-safe LRU cache with hit/miss counters
+#   maxsize=0 disables caching, every lookup is then a miss
+class LRUCache:
+
+    def __init__(self,maxsize=default_cache_size,name=''):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self,key):
+        return key in self._data
+
+    # return the cached value and mark it most recently used, or default on a miss
+    def get(self,key,default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # store a value, evicting the least recently used entries beyond maxsize
+    def put(self,key,value):
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # return the cached value for key, computing and storing it with fn() on a miss
+    #   fn runs outside the lock, so two sessions missing together may both compute
+    def get_or_compute(self,key,fn):
+        missing = object()
+        value = self.get(key,missing)
+        if value is missing:
+            value = fn()
+            self.put(key,value)
+        return value
+
+    def resize(self,maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > max(maxsize,0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'name':self.name,
+                'size':len(self._data),
+                'maxsize':self.maxsize,
+                'hits':self.hits,
+                'misses':self.misses,
+                'hit_rate':self.hits/lookups if lookups else 0.0}
@@ -0,0 +1,390 @@
+# Climate Dashboard lookup tables
+#   indexed versions of the CSV data used by Climate_fx, built once and
+#   shared by every call so lookups never scan the source tables
+
+import csv
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from Climate_metrics import timed
+
+# grid emissions coefficient used for ZIP codes that are missing or not rated (kg-CO2 / kWh)
+zip_default_coeff = 0.5555
+# 5-digit ZIP codes index directly into dense arrays of this length
+zip_max = 100000
+# source table for the ZIP coefficients
+zip_csv_file = "zip_coefficients.csv"
+# source table for vehicle fuel economy
+veh_csv_file = "Vehicles_data.csv"
+# 3-digit ZIP prefix ranges of each state, territory and military postal code
+zip3_csv_file = "zip3_states.csv"
+# memory-map the binary cache, except in the browser (Pyodide) where the file is read instead
+zip_cache_mmap = sys.platform != 'emscripten'
+# number of bins in the precomputed national coefficient histogram
+zip_hist_bins = 40
+
+
+# dense ZIP -> grid emissions coefficient index
+#   coefficients are dictionary encoded: codes[zip] points into palette,
+#   and code 0 is reserved for the default so missing ZIPs and NA rows
+#   resolve the same way in scalar and batch lookups
+class ZipCoeffIndex:
+
+    def __init__(self,codes,palette):
+        self.codes = codes          # integer code per ZIP, length zip_max
+        self.palette = palette      # coefficient per code, palette[0] is the default
+        # the index is shared by every session in a process, so it is made read-only
+        for a in (self.codes,self.palette):
+            a.setflags(write=False)
+
+    @property
+    def default(self):
+        return float(self.palette[0])
+
+    # build the index from parallel arrays of ZIP codes and coefficients (NaN for NA rows)
+    @classmethod
+    def from_columns(cls,zips,coeffs,default=zip_default_coeff):
+        zips = np.asarray(zips,dtype=np.int64)
+        coeffs = np.asarray(coeffs,dtype=np.float64)
+        rated = np.isfinite(coeffs) & (zips >= 0) & (zips < zip_max)
+        values = np.unique(coeffs[rated])
+        palette = np.concatenate(([default],values))
+        dtype = np.uint8 if len(palette) <= 256 else np.uint16
+        codes = np.zeros(zip_max,dtype=dtype)
+        codes[zips[rated]] = np.searchsorted(values,coeffs[rated]) + 1
+        return cls(codes,palette)
+
+    # build the index from a DataFrame with 'zip' and 'Coefficient' columns
+    @classmethod
+    def from_frame(cls,coeff_data,default=zip_default_coeff):
+        return cls.from_columns(coeff_data['zip'].values,coeff_data['Coefficient'].values,default)
+
+    # scalar lookup, returns the default for anything that is not a known 5-digit ZIP
+    @timed('zip_lookup')
+    def lookup(self,zip):
+        try:
+            z = int(zip)
+        except (TypeError,ValueError):
+            return self.default
+        if 0 <= z < zip_max:
+            return float(self.palette[self.codes[z]])
+        return self.default
+
+    # vectorized lookup, returns a float array shaped like zips
+    @timed('zip_lookup_many')
+    def lookup_many(self,zips):
+        z = np.asarray(zips)
+        if z.dtype.kind == 'f':
+            z = np.where(np.isfinite(z),z,-1)
+        z = z.astype(np.int64)
+        known = (z >= 0) & (z < zip_max)
+        codes = np.zeros(z.shape,dtype=self.codes.dtype)
+        codes[known] = self.codes[z[known]]
+        return self.palette[codes]
+
+
+# vehicle fuel economy catalog
+#   one row per 'Vehicle Type', held as parallel arrays so usage for any
+#   number of vehicles can be computed in a single NumPy pass
+class VehicleCatalog:
+
+    def __init__(self,models,fe_city,fe_hwy,is_ev):
+        self.models = list(models)
+        self.index = {m:i for i,m in enumerate(self.models)}
+        self.fe_city = np.asarray(fe_city,dtype=np.float64)    # city fuel economy, MPG or MPKWh
+        self.fe_hwy = np.asarray(fe_hwy,dtype=np.float64)      # highway fuel economy, MPG or MPKWh
+        self.is_ev = np.asarray(is_ev,dtype=bool)              # True where economy is in MPKWh
+        for a in (self.fe_city,self.fe_hwy,self.is_ev):
+            a.setflags(write=False)
+
+    # build the catalog from the vehicle CSV without pandas
+    @classmethod
+    def from_csv(cls,csv_file=veh_csv_file):
+        with open(csv_file,newline='') as f:
+            rows = list(csv.DictReader(f))
+        return cls([r['Vehicle Type'] for r in rows],
+                   [float(r['FE_City']) for r in rows],
+                   [float(r['FE_Highway']) for r in rows],
+                   [r['FE_Unit']=='MPKWh' for r in rows])
+
+    # build the catalog from a DataFrame with the Vehicles_data.csv columns
+    @classmethod
+    def from_frame(cls,veh_data):
+        return cls(veh_data['Vehicle Type'],veh_data['FE_City'],veh_data['FE_Highway'],
+                   veh_data['FE_Unit']=='MPKWh')
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self,model):
+        return model in self.index
+
+    # row number for one model, raises KeyError for unknown models
+    def index_of(self,model):
+        return self.index[model]
+
+    # row numbers for a sequence of models
+    @timed('vehicle_lookup')
+    def indices(self,models):
+        return np.fromiter((self.index[m] for m in models),dtype=np.intp)
+
+    def ev_models(self):
+        return [m for m,ev in zip(self.models,self.is_ev) if ev]
+
+    def ice_models(self):
+        return [m for m,ev in zip(self.models,self.is_ev) if not ev]
+
+
+# national and regional summaries of the rated ZIP coefficients, precomputed at build time
+#   arrays come from the stats file written by build_zip_stats:
+#     percentile                  percentile rank of each palette code among rated ZIPs
+#     hist_edges, hist_counts     national histogram of rated ZIPs
+#     quantile_levels, quantiles  national quantiles (0, 10, 25, 50, 75, 90, 100)
+#     zip3_state                  state number per 3-digit prefix, -1 if unassigned
+#     states                      state, territory and military postal codes
+#     zip3_*, state_*             count, mean, min and max per prefix / state (NaN if no rated ZIPs)
+class ZipCoeffStats:
+
+    def __init__(self,index,arrays):
+        self.index = index
+        for k,v in arrays.items():
+            setattr(self,k,v)
+        self.state_number = {s:i for i,s in enumerate(self.states)}
+        self._grid = None
+
+    @property
+    def count(self):
+        return int(self.hist_counts.sum())
+
+    # every ZIP's palette code as a (3-digit prefix, last two digits) image, built once
+    #   codes sort with their coefficients, so the image can be colored directly; 0 is unrated
+    def code_grid(self):
+        if self._grid is None:
+            self._grid = np.array(self.index.codes).reshape(zip_max // 100,100)
+            self._grid.setflags(write=False)
+        return self._grid
+
+    # percentile rank of a ZIP's coefficient among all rated ZIPs (unknown ZIPs use the default)
+    def percentile_of(self,zip):
+        z = safe_zip(zip)
+        return float(self.percentile[self.index.codes[z] if 0 <= z < zip_max else 0])
+
+    # postal code of the state a ZIP belongs to, or None
+    def state_of(self,zip):
+        z = safe_zip(zip)
+        if not 0 <= z < zip_max or self.zip3_state[z // 100] < 0:
+            return None
+        return str(self.states[self.zip3_state[z // 100]])
+
+    # count, mean, min and max coefficient of the rated ZIPs sharing a ZIP's 3-digit prefix
+    def zip3_summary(self,zip):
+        z = safe_zip(zip)
+        if not 0 <= z < zip_max:
+            return None
+        p = z // 100
+        return {'prefix':'%03d' % p,'count':int(self.zip3_count[p]),'mean':float(self.zip3_mean[p]),
+                'min':float(self.zip3_min[p]),'max':float(self.zip3_max[p])}
+
+    # count, mean, min and max coefficient of the rated ZIPs in a state
+    def state_summary(self,state):
+        i = self.state_number.get(state)
+        if i is None:
+            return None
+        return {'state':state,'count':int(self.state_count[i]),'mean':float(self.state_mean[i]),
+                'min':float(self.state_min[i]),'max':float(self.state_max[i])}
+
+# function to convert a ZIP to an int, -1 when it is not a number
+def safe_zip(zip):
+    try:
+        return int(zip)
+    except (TypeError,ValueError):
+        return -1
+
+# function to read the 3-digit prefix ranges into a state number per prefix and the state codes
+def read_zip3_states(csv_file=zip3_csv_file):
+    ranges = []
+    with open(csv_file,newline='') as f:
+        for row in csv.DictReader(f):
+            ranges.append((int(row['first']),int(row['last']),row['state']))
+    states = sorted({r[2] for r in ranges})
+    number = {s:i for i,s in enumerate(states)}
+    zip3_state = np.full(zip_max // 100,-1,dtype=np.int16)
+    for first,last,state in ranges:
+        zip3_state[first:last+1] = number[state]
+    return zip3_state, np.array(states)
+
+# function to return count, mean, min and max of values per group number (n groups)
+def group_stats(groups,values,n):
+    count = np.bincount(groups,minlength=n)
+    total = np.bincount(groups,weights=values,minlength=n)
+    low = np.full(n,np.inf)
+    high = np.full(n,-np.inf)
+    np.minimum.at(low,groups,values)
+    np.maximum.at(high,groups,values)
+    empty = count == 0
+    with np.errstate(invalid='ignore',divide='ignore'):
+        mean = np.where(empty,np.nan,total / count)
+    return count, mean, np.where(empty,np.nan,low), np.where(empty,np.nan,high)
+
+# function to summarize the rated ZIPs of an index nationally, per 3-digit prefix and per state
+#   returns the arrays stored by build_zip_stats
+def zip_stats_arrays(index,zip3_file=zip3_csv_file,bins=zip_hist_bins):
+    zips = np.flatnonzero(index.codes)
+    values = index.palette[index.codes[zips]]
+    ranked = np.sort(values)
+    # midrank percentile, so ties (many ZIPs share a coefficient) land in the middle of their run
+    below = np.searchsorted(ranked,index.palette,'left')
+    upto = np.searchsorted(ranked,index.palette,'right')
+    hist_counts, hist_edges = np.histogram(values,bins)
+    levels = np.array([0,10,25,50,75,90,100])
+    zip3_state, states = read_zip3_states(zip3_file)
+    zip3 = zips // 100
+    zip3_count, zip3_mean, zip3_min, zip3_max = group_stats(zip3,values,len(zip3_state))
+    state = zip3_state[zip3]
+    known = state >= 0
+    state_count, state_mean, state_min, state_max = group_stats(state[known],values[known],len(states))
+    return {'percentile':(below + upto) / 2 / len(values) * 100,
+            'hist_edges':hist_edges,
+            'hist_counts':hist_counts,
+            'quantile_levels':levels,
+            'quantiles':np.percentile(values,levels),
+            'zip3_state':zip3_state,
+            'states':states,
+            'zip3_count':zip3_count,'zip3_mean':zip3_mean,'zip3_min':zip3_min,'zip3_max':zip3_max,
+            'state_count':state_count,'state_mean':state_mean,'state_min':state_min,'state_max':state_max}
+
+
+# function to return the binary cache paths that sit next to a ZIP coefficient CSV
+#   .npy holds the dense code array (memory-mappable), .json holds the palette and source hash
+def zip_cache_files(csv_file=zip_csv_file):
+    base = os.path.splitext(csv_file)[0]
+    return base + '.npy', base + '.json'
+
+# function to return the precomputed statistics file for a ZIP coefficient CSV
+def zip_stats_file(csv_file=zip_csv_file):
+    return os.path.splitext(csv_file)[0] + '_stats.npz'
+
+# function to hash a source file so caches can be checked for staleness
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path,'rb') as f:
+        for block in iter(lambda: f.read(1 << 20),b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# function to read the ZIP coefficient CSV without pandas
+#   returns parallel arrays of ZIP codes and coefficients, NA rows become NaN
+def read_zip_csv(csv_file=zip_csv_file):
+    zips = []
+    coeffs = []
+    with open(csv_file,newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        zcol = header.index('zip')
+        ccol = header.index('Coefficient')
+        for row in reader:
+            if not row:
+                continue
+            zips.append(int(row[zcol]))
+            value = row[ccol]
+            coeffs.append(float(value) if value not in ('','NA') else np.nan)
+    return np.array(zips,dtype=np.int64), np.array(coeffs,dtype=np.float64)
+
+# function to write a file through a temporary file that then replaces it
+#   running processes keep the pages of a memory-mapped old file, and readers (or a sibling
+#   process rebuilding at the same time) never see a half-written one
+def replace_file(path,write,mode='wb'):
+    tmp = '%s.%d.tmp' % (path,os.getpid())
+    try:
+        with open(tmp,mode) as f:
+            write(f)
+        os.replace(tmp,path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# function to convert the ZIP coefficient CSV into its binary cache
+#   returns the index that was written; the metadata is written last, so a reader that sees
+#   the new source hash also sees the new codes
+def build_zip_cache(csv_file=zip_csv_file,default=zip_default_coeff):
+    index = ZipCoeffIndex.from_columns(*read_zip_csv(csv_file),default=default)
+    npy_file, meta_file = zip_cache_files(csv_file)
+    replace_file(npy_file,lambda f: np.save(f,index.codes))
+    meta = {'source': os.path.basename(csv_file),
+            'source_sha1': file_sha1(csv_file),
+            'palette': index.palette.tolist()}
+    replace_file(meta_file,lambda f: json.dump(meta,f),'w')
+    build_zip_stats(csv_file,index)
+    return index
+
+# function to precompute the national, prefix and state summaries for a ZIP coefficient CSV
+#   stored next to the binary cache with the hashes of both source tables
+def build_zip_stats(csv_file=zip_csv_file,index=None,zip3_file=zip3_csv_file):
+    if index is None:
+        index = load_zip_index(csv_file)
+    arrays = zip_stats_arrays(index,zip3_file)
+    hashes = {'source_sha1':file_sha1(csv_file),'zip3_sha1':file_sha1(zip3_file)}
+    replace_file(zip_stats_file(csv_file),lambda f: np.savez(f,**hashes,**arrays))
+    return ZipCoeffStats(index,arrays)
+
+# function to load the ZIP index from its binary cache if it is current
+#   returns None if the cache is missing or was built from a different CSV
+#   a cache shipped without its CSV is trusted as-is
+def read_zip_cache(csv_file=zip_csv_file,mmap=zip_cache_mmap):
+    npy_file, meta_file = zip_cache_files(csv_file)
+    if not (os.path.exists(npy_file) and os.path.exists(meta_file)):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if os.path.exists(csv_file) and meta.get('source_sha1') != file_sha1(csv_file):
+        return None
+    codes = np.load(npy_file,mmap_mode='r' if mmap else None)
+    palette = np.array(meta['palette'],dtype=np.float64)
+    return ZipCoeffIndex(codes,palette)
+
+# function to load the ZIP index, preferring the memory-mapped binary cache
+#   falls back to parsing the CSV, and refreshes a stale cache when the directory is writable
+def load_zip_index(csv_file=zip_csv_file,rebuild=True):
+    index = read_zip_cache(csv_file)
+    if index is not None:
+        return index
+    if rebuild:
+        try:
+            build_zip_cache(csv_file)
+            return read_zip_cache(csv_file)
+        except OSError:
+            pass
+    return ZipCoeffIndex.from_columns(*read_zip_csv(csv_file))
+
+# function to load the precomputed ZIP statistics, rebuilding them if a source table changed
+#   like the binary cache, a stats file shipped without its CSVs is trusted as-is
+def load_zip_stats(csv_file=zip_csv_file,index=None,zip3_file=zip3_csv_file,rebuild=True):
+    if index is None:
+        index = load_zip_index(csv_file)
+    stats_file = zip_stats_file(csv_file)
+    if os.path.exists(stats_file):
+        with np.load(stats_file) as data:
+            arrays = {k:data[k] for k in data.files}
+        current = all(not os.path.exists(path) or str(arrays[key]) == file_sha1(path)
+                      for key,path in (('source_sha1',csv_file),('zip3_sha1',zip3_file)))
+        if current:
+            del arrays['source_sha1'], arrays['zip3_sha1']
+            return ZipCoeffStats(index,arrays)
+    if rebuild:
+        try:
+            return build_zip_stats(csv_file,index,zip3_file)
+        except OSError:
+            pass
+    return ZipCoeffStats(index,zip_stats_arrays(index,zip3_file))
+
+
+# build step: python Climate_data.py [zip_coefficients.csv ...]
+if __name__ == '__main__':
+    for path in sys.argv[1:] or [zip_csv_file]:
+        built = build_zip_cache(path)
+        print(path, '->', ', '.join(zip_cache_files(path) + (zip_stats_file(path),)),
+              '(%d coefficients)' % (len(built.palette) - 1))
@@ -1,28 +1,72 @@
 # import relevant functions
-import panel as pn
-import hvplot.pandas
-import pandas as pd
+#   only NumPy is needed for the calculations; pandas and the plotting stack
+#   (hvplot, bokeh) are imported by the chart functions on first use, and the
+#   lookup tables are loaded the first time they are needed
+import os
+
 import numpy as np
-import jupyter_bokeh
-import matplotlib.pyplot as plt
-from bokeh.io import curdoc
-from bokeh.io import output_notebook
-from bokeh.models import HoverTool
-hvplot.extension('bokeh')
+import Climate_metrics as metrics
+from Climate_cache import LRUCache, default_cache_size
+from Climate_data import VehicleCatalog, ZipCoeffIndex, load_zip_index, load_zip_stats, veh_csv_file, zip_csv_file
+
+
+# function to return the vehicle catalog, loading Vehicles_data.csv on first use
+def vehicle_catalog():
+    global _veh_catalog
+    if _veh_catalog is None:
+        _veh_catalog = VehicleCatalog.from_csv(veh_csv_file)
+    return _veh_catalog
+
+# function to return the ZIP code grid coefficient index in kg-CO2 / kWh, loading it on first use
+#   memory-mapped from the binary cache built by Climate_data.py, falling back to the CSV
+def zip_index():
+    global _grid_coeff_index
+    if _grid_coeff_index is None:
+        _grid_coeff_index = load_zip_index(zip_csv_file)
+    return _grid_coeff_index
+
+# function to return the precomputed national / prefix / state coefficient summaries, loaded on first use
+def zip_stats():
+    global _grid_coeff_stats
+    if _grid_coeff_stats is None:
+        _grid_coeff_stats = load_zip_stats(zip_csv_file,zip_index())
+    return _grid_coeff_stats
 
-pn.extension(design='bootstrap')
+_veh_catalog = None
+_grid_coeff_index = None
+_grid_coeff_stats = None
 
+# function to load the lookup tables and ZIP statistics now rather than on first use
+#   used by servers before they fork so worker processes start with the tables ready
+def load_tables():
+    return vehicle_catalog(), zip_index(), zip_stats()
 
-# load sample vehicle data
-csv_file = ("Vehicles_data.csv")
-veh_data = pd.read_csv(csv_file)
-veh_list = list(veh_data['Vehicle Type'])
-veh_list_ev = list(veh_data[veh_data['FE_Unit']=='MPKWh']['Vehicle Type'])
-veh_list_ice = list(veh_data[veh_data['FE_Unit']=='MPG']['Vehicle Type'])
+# function to import pandas with the hvplot accessor registered, for the chart functions
+def plotting():
+    import pandas as pd
+    import hvplot.pandas
+    return pd
 
-# load zip code energy coefficient lookup data in kg-CO2 / kWh
-csv_file = ("zip_coefficients.csv")
-grid_coeff_data = pd.read_csv(csv_file)
+# the module-level tables are loaded lazily when first accessed:
+#   veh_catalog, veh_list, veh_list_ev, veh_list_ice and grid_coeff_index from the
+#   indexed tables, and the raw veh_data / grid_coeff_data DataFrames (needs pandas)
+def __getattr__(name):
+    if name == 'veh_catalog':
+        return vehicle_catalog()
+    if name == 'veh_list':
+        return list(vehicle_catalog().models)
+    if name == 'veh_list_ev':
+        return vehicle_catalog().ev_models()
+    if name == 'veh_list_ice':
+        return vehicle_catalog().ice_models()
+    if name == 'grid_coeff_index':
+        return zip_index()
+    if name in ('grid_coeff_data','veh_data'):
+        import pandas as pd
+        data = pd.read_csv(zip_csv_file if name == 'grid_coeff_data' else veh_csv_file)
+        globals()[name] = data
+        return data
+    raise AttributeError("module %r has no attribute %r" % (__name__,name))
 
 # establish other lookup coefficients
 # fossil fuels
@@ -56,28 +100,67 @@ textcolor = 'black'
 backcolor1 = 'darkgrey'
 backcolor2 = 'lightgrey'
 
+# function to return the ZIP index for a coefficient table
+#   accepts a prebuilt ZipCoeffIndex or a DataFrame with 'zip' and 'Coefficient' columns
+def coeff_index(coeff_data):
+    if isinstance(coeff_data,ZipCoeffIndex):
+        return coeff_data
+    if coeff_data is globals().get('grid_coeff_data'):
+        return zip_index()
+    return ZipCoeffIndex.from_frame(coeff_data)
+
 # function to return grid emissions coefficient in (kg-CO2 / kWh) for a given ZIP code
+#   unknown ZIP codes and ZIP codes without a rating return the 0.5555 default
 def coeff_lookup(coeff_data,zip=43017):
-    if zip in coeff_data['zip'].values:
-        rows = coeff_data[coeff_data['zip']==zip]
-        return rows['Coefficient'].iloc[0]
-    else:
-        return 0.5555
+    return coeff_index(coeff_data).lookup(zip)
+
+# function to return an array of grid emissions coefficients for an array of ZIP codes
+def coeff_lookup_many(coeff_data,zips):
+    return coeff_index(coeff_data).lookup_many(zips)
+
+# function to return the vehicle catalog for a vehicle table
+#   accepts a prebuilt VehicleCatalog or a DataFrame with the Vehicles_data.csv columns
+def veh_catalog_for(veh_data):
+    if isinstance(veh_data,VehicleCatalog):
+        return veh_data
+    if veh_data is globals().get('veh_data'):
+        return vehicle_catalog()
+    return VehicleCatalog.from_frame(veh_data)
 
 # function to check if a vehicle is electric or gas powered    
 def get_veh_type(veh_data,model):
-    rows = veh_data[veh_data['Vehicle Type']==model]    
-    if rows['FE_Unit'].iloc[0]=='MPKWh':
+    catalog = veh_catalog_for(veh_data)
+    if catalog.is_ev[catalog.index_of(model)]:
         return 'EV'
     else:
         return 'ICE'
 
 def check_ev(vt):
-    type = get_veh_type(veh_data,vt)
-    if type == 'EV':
-        return True
-    else:
-        return False
+    catalog = vehicle_catalog()
+    return bool(catalog.is_ev[catalog.index_of(vt)])
+
+# batched vehicle usage for N vehicles in one NumPy pass
+#   idx are catalog row numbers, mileage / pct_hwy / zipcoeff broadcast against them
+#   returns unrounded arrays of fuel in gallons, energy in kWh and emissions in kg-CO2
+#   EVs burn no gallons and take their emissions from the grid coefficient
+def veh_usage_many(catalog,idx,mileage,pct_hwy,timeconv=1,zipcoeff=0.5555):
+    idx = np.asarray(idx,dtype=np.intp)
+    hwy = np.asarray(pct_hwy,dtype=np.float64)/100
+    fe = catalog.fe_hwy[idx]*hwy + catalog.fe_city[idx]*(1-hwy)
+    fuel_usage = np.asarray(mileage,dtype=np.float64) / fe * timeconv
+    ev = catalog.is_ev[idx]
+    gal = np.where(ev,0.0,fuel_usage)
+    kwh = np.where(ev,fuel_usage,fuel_usage*petrol_kwh_coeff)
+    co2 = np.where(ev,fuel_usage*zipcoeff,fuel_usage*petrol_co2_coeff)
+    return {'gal':gal,'kwh':kwh,'co2':co2}
+
+# function to return a single vehicle's fuel (gal), energy (kWh) and emissions (kg-CO2) together
+#   values are rounded to 1 decimal for display, see get_veh_usage
+def get_veh_usage_all(veh_data,model,mileage,pct_hwy,timeconv=1,zip=0):
+    catalog = veh_catalog_for(veh_data)
+    usage = veh_usage_many(catalog,catalog.index_of(model),mileage,pct_hwy,
+                           timeconv=timeconv,zipcoeff=coeff_lookup(zip_index(),zip))
+    return {k:round(float(v),1) for k,v in usage.items()}
 
 # multipurpose function to return vehicle fuel usage given model, mileage, and % highway driving
 #   if vehicle fuel economy units are MPKWh (electric vehicles):
@@ -91,28 +174,7 @@ def check_ev(vt):
 #   optionally scales output by timeconv value (such as yearly-to-weekly)
 #
 def get_veh_usage(veh_data,model,mileage,pct_hwy,retval='kwh',timeconv=1,zip=0):
-
-    rows = veh_data[veh_data['Vehicle Type']==model]
-    hwy_fe = rows['FE_Highway'].iloc[0]
-    city_fe = rows['FE_City'].iloc[0]
-    fe = hwy_fe*pct_hwy/100 + city_fe*(1-pct_hwy/100)
-    fuel_usage = mileage / fe * timeconv
-
-    if rows['FE_Unit'].iloc[0]=='MPKWh':
-        if retval == 'kwh':
-            return round(fuel_usage,1)
-        elif retval == 'gal':
-            return 0
-        elif retval == 'co2':
-            zipcoeff = coeff_lookup(grid_coeff_data,zip)
-            return round(fuel_usage*zipcoeff,1)
-    else:
-        if retval == 'kwh':
-            return(round(fuel_usage*petrol_kwh_coeff,1))
-        elif retval == 'gal':
-            return round(fuel_usage,1)
-        elif retval == 'co2':
-            return round(fuel_usage*petrol_co2_coeff,1)
+    return get_veh_usage_all(veh_data,model,mileage,pct_hwy,timeconv=timeconv,zip=zip)[retval]
 
 # function to multiply values during responsive notebook usage
 def convert(inputval,conversion1,conversion2 = 1):
@@ -124,12 +186,19 @@ def arraysum(inputarray):
         asum+=i
     return asum
 
-# function to look up a value from a list
+# function to look up a value from a list by its 1-based dashboard index (e.g. diet type 1-6)
+#   out-of-range indexes raise ValueError
 def list_lookup(list_data,ind=1):
-    if ind <= len(list_data):
-        return list_data[ind]
-    else:
-        return list_data[0]
+    if not 1 <= ind <= len(list_data):
+        raise ValueError('index must be 1-%d, not %r' % (len(list_data),ind))
+    return list_data[ind - 1]
+
+# vectorized list_lookup for an array of indexes
+def list_lookup_many(list_data,ind):
+    ind = np.asarray(ind,dtype=np.int64)
+    if ((ind < 1) | (ind > len(list_data))).any():
+        raise ValueError('indexes must be 1-%d' % len(list_data))
+    return np.asarray(list_data,dtype=np.float64)[ind - 1]
 
 # function to plot the output during responsive usage
 def plot_usage(inputs, usage, sources, pop=2):
@@ -140,6 +209,8 @@ def plot_usage(inputs, usage, sources, pop=2):
     consumption = {inputs[i]:np.array([convert(usage[i],kwh_to_watts,1/pop),0]) for i in range(len(inputs))}
     #consumption = {inputs[i]:np.array([usage[i],0]) for i in range(len(inputs))}
     consumption['Target'] = np.array([0,weekly_target_W])
+    pd = plotting()
+    from bokeh.models import HoverTool
     condf = pd.DataFrame(consumption)
     condf.index=sources
     hover = HoverTool()
@@ -150,9 +221,294 @@ def plot_usage(inputs, usage, sources, pop=2):
     #fig=condf
     return fig
 
+# footprint categories, in the order they are stacked on both charts
+footprint_categories = ['EV Grid','ICE Fuel Usage','Public Transit','Air Travel',
+                        'HH Elec Grid','HH NatGas Usage','HH Diet Impact']
+
+# weekly footprint for one set of household inputs
+#   computed once by compute_footprint and shared by both charts and all readouts
+#   vehicles:   per-vehicle weekly 'gal', 'kwh' and 'co2' arrays, rounded to 0.1 as displayed
+#   household:  weekly household totals per category for 'gal', 'kwh' and 'co2'
+#               (diet is per adult, as entered)
+#   watts, co2: per HH member values per category, as stacked on the charts
+class Footprint:
+
+    def __init__(self,zipcoeff,pop,vehicles,household,watts,co2,key=None):
+        self.key = key          # normalized input tuple when the footprint came from the cache
+        self.zipcoeff = zipcoeff
+        self.pop = pop
+        self.vehicles = vehicles
+        self.household = household
+        self.watts = watts
+        self.co2 = co2
+
+    @property
+    def total_watts(self):
+        return sum(self.watts.values())
+
+    @property
+    def total_co2(self):
+        return sum(self.co2.values())
+
+# trip modes and household energy sources of a Household, by position
+trip_modes = ['transit','air']          # annual rider miles, annual flight hours
+energy_kinds = ['electric','gas']       # monthly kWh, monthly ccf
+
+# function to normalize an input number for keys: whole numbers as int, others as float
+def key_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+# inputs of one household, with any number of vehicles, trips and energy sources
+#   vehicles:   (model, % highway, annual miles) per vehicle
+#   trips:      (mode, annual amount) per trip, mode one of trip_modes
+#   energy:     (kind, monthly amount) per energy source, kind one of energy_kinds
+#   zip, pop:   ZIP code for the grid coefficient and adults in the household
+#   hd, hdt:    daily calories per adult and diet type, as on the dashboard
+#   the footprint only depends on the trip and energy totals per mode / kind, so the key
+#   (used by the result caches and share links) keeps the vehicles and those totals
+class Household:
+
+    def __init__(self,vehicles=(),trips=(),energy=(),zip=0,pop=2,hd=2000,hdt=4):
+        self.vehicles = [(str(t),key_number(h),key_number(m)) for t,h,m in vehicles]
+        self.trips = [(mode,float(amount)) for mode,amount in trips]
+        self.energy = [(kind,float(amount)) for kind,amount in energy]
+        for mode,amount in self.trips:
+            if mode not in trip_modes:
+                raise ValueError('trip mode must be one of %s, not %r' % (', '.join(trip_modes),mode))
+        for kind,amount in self.energy:
+            if kind not in energy_kinds:
+                raise ValueError('energy kind must be one of %s, not %r' % (', '.join(energy_kinds),kind))
+        try:
+            self.zip = int(zip)
+        except (TypeError,ValueError,OverflowError):
+            self.zip = -1
+        self.pop = key_number(pop)
+        self.hd = key_number(hd)
+        self.hdt = int(hdt)
+
+    # the dashboard's fixed signature: four vehicles, transit, air, electric and gas
+    @classmethod
+    def from_inputs(cls,t1,h1,m1,t2,h2,m2,t3,h3,m3,t4,h4,m4,pt,at,he,hg,zip=0,pop=2,hd=2000,hdt=4):
+        return cls([(t1,h1,m1),(t2,h2,m2),(t3,h3,m3),(t4,h4,m4)],
+                   [('transit',pt),('air',at)],[('electric',he),('gas',hg)],zip,pop,hd,hdt)
+
+    @classmethod
+    def from_key(cls,key):
+        vehicles, pt, at, he, hg, zip, pop, hd, hdt = key
+        return cls(vehicles,[('transit',pt),('air',at)],[('electric',he),('gas',hg)],zip,pop,hd,hdt)
+
+    # trip totals per mode then energy totals per kind: (transit, air, electric, gas)
+    def totals(self):
+        trips = np.bincount([trip_modes.index(m) for m,a in self.trips],[a for m,a in self.trips],
+                            minlength=len(trip_modes))
+        energy = np.bincount([energy_kinds.index(k) for k,a in self.energy],[a for k,a in self.energy],
+                             minlength=len(energy_kinds))
+        return tuple(float(v) for v in np.concatenate([trips,energy]))
+
+    # normalized, hashable inputs: (vehicles, transit, air, electric, gas, zip, pop, hd, hdt)
+    @property
+    def key(self):
+        return (tuple(self.vehicles),) + tuple(key_number(v) for v in self.totals()) + (self.zip,self.pop,self.hd,self.hdt)
+
+    # catalog rows, annual miles and % highway of the vehicles as (1,V) arrays
+    def vehicle_arrays(self):
+        catalog = vehicle_catalog()
+        idx = catalog.indices([t for t,h,m in self.vehicles])
+        mileage = np.array([m for t,h,m in self.vehicles],dtype=np.float64)
+        pct_hwy = np.array([h for t,h,m in self.vehicles],dtype=np.float64)
+        return idx[np.newaxis], mileage[np.newaxis], pct_hwy[np.newaxis]
+
+# vectorized footprint model for N households with V vehicles each
+#   veh_idx, mileage and pct_hwy are (N,V) arrays (catalog rows, annual miles, % highway)
+#   the remaining inputs are length-N arrays or scalars, zipcoeff in kg-CO2 / kWh
+#   any number of leading axes broadcast the same way, e.g. (M,K,1,V) vehicles against
+#   (1,1,D) diets; each category then only has the shape of the inputs it depends on
+#   returns 'vehicles' ('gal','kwh','co2' -> (N,V) rounded to 0.1 as displayed),
+#   'household' ('gal','kwh','co2' -> category -> (N,) weekly household totals) and
+#   'watts' / 'co2' (category -> (N,) per HH member values)
+#   all values are amortized across household population except daily calories,
+#   which are already per adult
+@metrics.timed('footprint_arrays')
+def footprint_arrays(veh_idx,mileage,pct_hwy,pt,at,he,hg,zipcoeff,pop,hd,hdt):
+    veh_idx = np.atleast_2d(veh_idx)
+    zipcoeff = np.asarray(zipcoeff,dtype=np.float64)
+    pop = np.asarray(pop,dtype=np.float64)
+    # all vehicles at once, converted to weekly usage
+    catalog = vehicle_catalog()
+    ev = catalog.is_ev[veh_idx]
+    usage = veh_usage_many(catalog,veh_idx,np.atleast_2d(mileage),np.atleast_2d(pct_hwy),
+                           timeconv=year_to_week,zipcoeff=zipcoeff[...,np.newaxis])
+    vehicles = {k:np.round(v,1) for k,v in usage.items()}
+    ev_sum = lambda v: np.where(ev,v,0.0).sum(axis=-1)
+    ice_sum = lambda v: np.where(ev,0.0,v).sum(axis=-1)
+    zero = np.zeros(veh_idx.shape[:-1])
+    # weekly household totals per category
+    gal = {'EV Grid':zero,
+           'ICE Fuel Usage':ice_sum(vehicles['gal']),
+           'Public Transit':pt/pubtrans_fe*year_to_week + zero,
+           'Air Travel':at*air_fe_rate*year_to_week + zero,
+           'HH Elec Grid':zero,
+           'HH NatGas Usage':zero,
+           'HH Diet Impact':zero}
+    kwh = {'EV Grid':ev_sum(vehicles['kwh']),
+           'ICE Fuel Usage':ice_sum(vehicles['kwh']),
+           'Public Transit':pt/pubtrans_fe*petrol_kwh_coeff*year_to_week + zero,
+           'Air Travel':at*air_fe_rate*petrol_kwh_coeff*year_to_week + zero,
+           'HH Elec Grid':he*month_to_week + zero,
+           'HH NatGas Usage':hg*natgas_kwh_coeff*month_to_week + zero,
+           'HH Diet Impact':hd*diet_kcal_to_kwh*list_lookup_many(diet_prod_mult,hdt)*7 + zero}  # *7 = day to week
+    co2 = {'EV Grid':ev_sum(vehicles['co2']),
+           'ICE Fuel Usage':ice_sum(vehicles['co2']),
+           'Public Transit':pt/pubtrans_fe*petrol_co2_coeff*year_to_week + zero,
+           'Air Travel':at*air_fe_rate*petrol_co2_coeff*year_to_week + zero,
+           'HH Elec Grid':he*month_to_week*zipcoeff + zero,
+           'HH NatGas Usage':hg*natgas_co2_coeff*month_to_week + zero,
+           'HH Diet Impact':hd*list_lookup_many(diet_co2_eq,hdt)*7/1000 + zero}
+    # per HH member values for the charts
+    share = {c:(1 if c=='HH Diet Impact' else pop) for c in footprint_categories}
+    return {'vehicles':vehicles,
+            'household':{'gal':gal,'kwh':kwh,'co2':co2},
+            'watts':{c:kwh[c]*kwh_to_watts/share[c] for c in footprint_categories},
+            'co2':{c:co2[c]/share[c] for c in footprint_categories}}
+
+# function to calculate the weekly footprint of a Household
+#   all vehicles go through the vectorized model at once, however many there are
+@metrics.timed('compute_footprint')
+def household_footprint(household):
+    zipcoeff = coeff_lookup(zip_index(),household.zip)
+    pt, at, he, hg = household.totals()
+    res = footprint_arrays(*household.vehicle_arrays(),
+                           pt,at,he,hg,zipcoeff,household.pop,household.hd,household.hdt)
+    first = lambda d: {c:float(v[0]) for c,v in d.items()}
+    return Footprint(zipcoeff,household.pop,
+                     {k:v[0] for k,v in res['vehicles'].items()},
+                     {k:first(v) for k,v in res['household'].items()},
+                     first(res['watts']),
+                     first(res['co2']))
+
+# function to calculate the weekly household footprint from the dashboard inputs
+#   input variables are the user input widgets which pass dynamic values
+#   runs the same vectorized model as the bulk scoring API for a single household
+def compute_footprint(t1,h1,m1,
+                      t2,h2,m2,
+                      t3,h3,m3,
+                      t4,h4,m4,
+                      pt,at,
+                      he,hg,zip=0,
+                      pop=2,
+                      hd=2000,hdt=4
+                      ):
+    return household_footprint(Household.from_inputs(t1,h1,m1,t2,h2,m2,t3,h3,m3,t4,h4,m4,
+                                                     pt,at,he,hg,zip,pop,hd,hdt))
+
+# per-process caches shared by every dashboard session
+#   footprints are keyed on the normalized input tuple, charts on (chart, footprint key)
+footprint_cache = LRUCache(default_cache_size,name='footprint')
+chart_cache = LRUCache(default_cache_size,name='chart')
+
+# function to change the number of entries kept in both caches
+def set_cache_size(maxsize):
+    footprint_cache.resize(maxsize)
+    chart_cache.resize(maxsize)
+
+# function to return hit/miss counters for both caches
+def cache_stats():
+    stats = [footprint_cache.stats(),chart_cache.stats()]
+    if _result_store is not None:
+        stats.append(_result_store.stats())
+    return stats
+
+metrics.add_source('caches',cache_stats)
+
+# function to normalize dashboard inputs into a hashable cache key (the Household key)
+#   widgets hand over ints and model names; anything else is coerced the same way
+def footprint_key(t1,h1,m1,t2,h2,m2,t3,h3,m3,t4,h4,m4,pt,at,he,hg,zip=0,pop=2,hd=2000,hdt=4):
+    return Household.from_inputs(t1,h1,m1,t2,h2,m2,t3,h3,m3,t4,h4,m4,pt,at,he,hg,zip,pop,hd,hdt).key
+
+# persistent result store behind the in-memory cache (a Climate_store.ResultStore), or None
+#   opened on first use from the CLIMATEDASH_RESULTS file when that is set
+def result_store():
+    global _result_store
+    if _result_store is None:
+        path = os.environ.get('CLIMATEDASH_RESULTS','')
+        if not path:
+            return None
+        from Climate_store import ResultStore
+        _result_store = ResultStore(path)
+    return _result_store
+
+# function to set (or with None, drop) the persistent result store
+def set_result_store(store):
+    global _result_store
+    _result_store = store
+
+_result_store = None
+
+# function to return the footprint for a set of inputs, reusing a cached result when possible
+#   takes a Household or the same arguments as compute_footprint; footprints missing from
+#   the in-memory cache are looked up in the persistent result store before they are computed
+@metrics.timed('cached_footprint')
+def cached_footprint(*args,**kwargs):
+    if len(args) == 1 and isinstance(args[0],Household):
+        household = args[0]
+    else:
+        household = Household.from_inputs(*args,**kwargs)
+    key = household.key
+    def compute():
+        store = result_store()
+        fp = store.get(key) if store is not None else None
+        if fp is None:
+            fp = household_footprint(household)
+            fp.key = key
+            for v in fp.vehicles.values():
+                v.setflags(write=False)
+            if store is not None:
+                store.put(key,fp)
+        return fp
+    return footprint_cache.get_or_compute(key,compute)
+
+# function to return a chart for a footprint, reusing the cached figure for cached footprints
+def cached_chart(name,build,fp):
+    if fp.key is None:
+        return build(fp)
+    return chart_cache.get_or_compute((name,fp.key),lambda: build(fp))
+
+# function to build the two-bar DataFrame behind a stacked chart: usage by category, then the target
+@metrics.timed('chart_dataframe')
+def chart_frame(values,target_name,target_value,labels):
+    consumption = {c:np.array([values[c],0]) for c in footprint_categories}
+    consumption[target_name] = np.array([0,target_value])
+    condf = plotting().DataFrame(consumption)
+    condf.index = labels
+    return condf
+
+# function to create the stacked bar chart of power consumption from a footprint
+def plot_power(fp):
+    return cached_chart('power',build_power_chart,fp)
+
+@metrics.timed('hvplot_power_chart')
+def build_power_chart(fp):
+    condf = chart_frame(fp.watts,'2000-W Target',weekly_target_W,['Your\nUsage\n','2000-W\nTarget\n'])
+    fig = condf.hvplot.bar(height=600, width=400, legend=True,stacked=True,
+                           title='Total Power Consumption (W) per HH member')
+    return fig
+
+# function to create the stacked bar chart of CO2 emissions from a footprint
+def plot_emissions(fp):
+    return cached_chart('emissions',build_emissions_chart,fp)
+
+@metrics.timed('hvplot_emissions_chart')
+def build_emissions_chart(fp):
+    condf2 = chart_frame(fp.co2,'Global Target',weekly_target_CO2,['Your\nUsage\n','2.5t kg-CO2/year\nTarget\n'])
+    fig2 = condf2.hvplot.bar(height=600, width=400, legend=True,stacked=True,
+                           title='Weekly CO2 emissions (kg) per HH member')
+    return fig2
+
 # function to calculate total power demand based on user inputs
 #   and create a stacked bar chart
 #   input variables are the user input widgets which pass dynamic values
+#   pass the ZIP code to share one footprint (and cache entry) with plot_co2
 def plot_usage_2(t1,h1,m1,
                 t2,h2,m2,
                 t3,h3,m3,
@@ -160,47 +516,13 @@ def plot_usage_2(t1,h1,m1,
                 pt,at,
                 he,hg,
                 pop=2,
-                hd=2000,hdt=4
+                hd=2000,hdt=4,zip=0
                 ):
-    # check vehicle types and make a list
-    tv = []
-    tv.append(get_veh_type(veh_data,t1))
-    tv.append(get_veh_type(veh_data,t2))
-    tv.append(get_veh_type(veh_data,t3))
-    tv.append(get_veh_type(veh_data,t4))
-    # convert user inputs to vehicle consumption in watts and make a list
-    wv = []
-    wv.append(get_veh_usage(veh_data,t1,m1,h1,timeconv=year_to_week)*kwh_to_watts)
-    wv.append(get_veh_usage(veh_data,t2,m2,h2,timeconv=year_to_week)*kwh_to_watts)
-    wv.append(get_veh_usage(veh_data,t3,m3,h3,timeconv=year_to_week)*kwh_to_watts)
-    wv.append(get_veh_usage(veh_data,t4,m4,h4,timeconv=year_to_week)*kwh_to_watts)
-    # calculate the stacked bar totals in watts
-    # all amortized across household population (except daily calories which is already individual)
-    wve = sum([wv[i] for i in range(4) if tv[i]=='EV'])/pop                 # vehicle electric
-    wvg = sum([wv[i] for i in range(4) if tv[i]!='EV'])/pop                 # vehicle gas
-    wp = pt/pubtrans_fe*petrol_kwh_coeff*year_to_week*kwh_to_watts/pop      # public transit
-    wa = at*air_fe_rate*petrol_kwh_coeff*year_to_week*kwh_to_watts/pop      # air travel
-    whe = he*month_to_week*kwh_to_watts/pop                                 # household electric
-    whg = hg*natgas_kwh_coeff*month_to_week*kwh_to_watts/pop                # household gas
-    whd = hd*diet_kcal_to_kwh*list_lookup(diet_prod_mult,hdt)*kwh_to_watts*7 # diet, *7 = day to week
-    # create the dictionary
-    consumption = {'EV Grid':np.array([wve,0]),
-                   'ICE Fuel Usage':np.array([wvg,0]),
-                   'Public Transit':np.array([wp,0]),
-                   'Air Travel':np.array([wa,0]),                                      
-                   'HH Elec Grid':np.array([whe,0]),
-                   'HH NatGas Usage':np.array([whg,0]),
-                   'HH Diet Impact':np.array([whd,0]),                   
-                   '2000-W Target':np.array([0,weekly_target_W])}
-    condf = pd.DataFrame(consumption)
-    condf.index=['Your\nUsage\n','2000-W\nTarget\n']
-    fig = condf.hvplot.bar(height=600, width=400, legend=True,stacked=True,
-                           title='Total Power Consumption (W) per HH member')
-
-    return fig
+    return plot_power(cached_footprint(t1,h1,m1,t2,h2,m2,t3,h3,m3,t4,h4,m4,
+                                       pt,at,he,hg,zip,pop,hd,hdt))
 
 
-# function to calculate total power demand based on user inputs
+# function to calculate total CO2 emissions based on user inputs
 #   and create a stacked bar chart
 #   input variables are the user input widgets which pass dynamic values
 def plot_co2(t1,h1,m1,
@@ -212,50 +534,14 @@ def plot_co2(t1,h1,m1,
             pop=2,
             hd=2000,hdt=4
             ):
-    
-    zipcoeff = coeff_lookup(grid_coeff_data,zip)
-    # check vehicle types and make a list
-    tv = []
-    tv.append(get_veh_type(veh_data,t1))
-    tv.append(get_veh_type(veh_data,t2))
-    tv.append(get_veh_type(veh_data,t3))
-    tv.append(get_veh_type(veh_data,t4))    
-    # convert user inputs to vehicle consumption in kg-CO2 and make a list
-    cv = []
-    cv.append(get_veh_usage(veh_data,t1,m1,h1,timeconv=year_to_week,retval='co2',zip=zip))
-    cv.append(get_veh_usage(veh_data,t2,m2,h2,timeconv=year_to_week,retval='co2',zip=zip))
-    cv.append(get_veh_usage(veh_data,t3,m3,h3,timeconv=year_to_week,retval='co2',zip=zip))
-    cv.append(get_veh_usage(veh_data,t4,m4,h4,timeconv=year_to_week,retval='co2',zip=zip))
-    # calculate the stacked bar totals in weekly kg-CO2
-    # all amortized across household population (except daily calories which is already individual)
-    cve = sum([cv[i] for i in range(4) if tv[i]=='EV'])/pop     # vehicle electric
-    cvg = sum([cv[i] for i in range(4) if tv[i]!='EV'])/pop     # vehicle gas
-    cpt = pt/pubtrans_fe*petrol_co2_coeff*year_to_week/pop      # public transit
-    cat = at*air_fe_rate*petrol_co2_coeff*year_to_week/pop      # air travel
-    che = he*month_to_week*zipcoeff/pop                         # household electric
-    chg = hg*natgas_co2_coeff*month_to_week/pop                 # household gas
-    chd = hd*list_lookup(diet_co2_eq,hdt)*7/1000                # diet, *7 = day to week
-    # create the dictionary
-    consumption2 = {'EV Grid':np.array([cve,0]),
-                   'ICE Fuel Usage':np.array([cvg,0]),
-                   'Public Transit':np.array([cpt,0]),
-                   'Air Travel':np.array([cat,0]),                                      
-                   'HH Elec Grid':np.array([che,0]),
-                   'HH NatGas Usage':np.array([chg,0]),
-                   'HH Diet Impact':np.array([chd,0]),                   
-                   'Global Target':np.array([0,weekly_target_CO2])}
-    condf2 = pd.DataFrame(consumption2)
-    condf2.index=['Your\nUsage\n','2.5t kg-CO2/year\nTarget\n']
-    fig2 = condf2.hvplot.bar(height=600, width=400, legend=True,stacked=True,
-                           title='Weekly CO2 emissions (kg) per HH member')
-
-    return fig2
+    return plot_emissions(cached_footprint(t1,h1,m1,t2,h2,m2,t3,h3,m3,t4,h4,m4,
+                                           pt,at,he,hg,zip,pop,hd,hdt))
 
 def plot3(h):
     # create the dictionary
     consumption3 = {'EV Grid':np.array([100,0]),
                    'New Target':np.array([0,300])}
-    condf3 = pd.DataFrame(consumption3)
+    condf3 = plotting().DataFrame(consumption3)
     condf3.index=['Your\nUsage\n','Fake\nTarget\n']
     fig3 = condf3.hvplot.bar(height=600, width=400, legend=True,stacked=True,
                            title='Fictitious Climate Impact #3')
@@ -0,0 +1,157 @@
+# Climate Dashboard weather-normalized heating model
+#   fits natural gas use per account from gas bill history as a degree-day regression
+#     ccf / day = baseload + slope * heating degree days / day
+#   where heating degree days are the degrees the bill's average temperature falls below
+#   the base temperature (65 F), then projects the use of a typical year for the household
+#   natural gas input and its CO2
+#
+#   every account is fitted at once: days-weighted least squares reduces to a handful of
+#   per-account sums, gathered with bincount, so thousands of accounts fit in one pass
+#
+#   usage: python Climate_heating.py <gas export> [...]   or   --store HISTORY_DIR
+#          prints the fit and typical-year projection per account as CSV
+
+import argparse
+import sys
+
+import numpy as np
+
+import Climate_bills as bills
+import Climate_fx as cf
+import Climate_metrics as metrics
+
+heating_base_temp = 65.0        # degree-day base temperature, deg F
+
+# fewer billing periods than this, or too little spread in degree days, fit the
+# baseload alone (flat use, no heating slope)
+min_fit_periods = 3
+min_hdd_spread = 1.0            # standard deviation of HDD / day across the account's bills
+
+days_per_year = 365
+month_days = np.array([31,28.25,31,30,31,30,31,31,30,31,30,31])
+
+# per account values of a fit, in CSV column order
+fit_fields = ['baseload','slope','r2','periods','annual_hdd','annual_ccf','monthly_ccf','weekly_co2','weekly_kwh']
+
+
+# heating model fitted per account, every field an array in accounts order
+#   baseload in ccf / day, slope in ccf / heating degree day, r2 of the days-weighted fit,
+#   periods the number of bills used, annual_hdd the typical-year heating degree days,
+#   annual_ccf / monthly_ccf the typical-year use, weekly_co2 / weekly_kwh the matching
+#   weekly household natural gas emissions and energy, as in the dashboard footprint
+class HeatingFit:
+
+    def __init__(self,accounts,baseload,slope,r2,periods,annual_hdd):
+        self.accounts = accounts
+        self.baseload = baseload
+        self.slope = slope
+        self.r2 = r2
+        self.periods = periods
+        self.annual_hdd = annual_hdd
+        self.annual_ccf = baseload*days_per_year + slope*annual_hdd
+        self.monthly_ccf = self.annual_ccf/12
+        self.weekly_co2 = self.annual_ccf*cf.natgas_co2_coeff*cf.year_to_week
+        self.weekly_kwh = self.annual_ccf*cf.natgas_kwh_coeff*cf.year_to_week
+
+    def __len__(self):
+        return len(self.accounts)
+
+    # function to return one account's fit as a dict
+    def get(self,account):
+        i = self.accounts.index(account)
+        return {k:float(getattr(self,k)[i]) for k in fit_fields}
+
+# function to fit the heating model for every account from billing period columns
+#   account is an integer code per bill (0..n_accounts-1), days / usage (ccf) / avg_temp
+#   (deg F) the bill values and end the read date (datetime64[D] or days since 1970-01-01);
+#   bills without a temperature or usage are left out
+#   typical-year degree days come from each account's own bills, averaged per calendar
+#   month; months an account has no bills for take the average over all accounts
+@metrics.timed('heating_fit')
+def fit_heating(account,days,usage,avg_temp,end,accounts=None,base_temp=heating_base_temp):
+    account = np.asarray(account,dtype=np.intp)
+    days = np.asarray(days,dtype=np.float64)
+    usage = np.asarray(usage,dtype=np.float64)
+    avg_temp = np.asarray(avg_temp,dtype=np.float64)
+    end = np.asarray(end).astype('datetime64[D]')
+    n = int(account.max()) + 1 if len(account) else 0
+    if accounts is None:
+        accounts = list(range(n))
+    n = max(n,len(accounts))
+    keep = (days > 0) & np.isfinite(usage) & np.isfinite(avg_temp)
+    account, days, usage, avg_temp, end = account[keep], days[keep], usage[keep], avg_temp[keep], end[keep]
+    # days-weighted sums per account of x = HDD / day and y = ccf / day
+    x = np.maximum(base_temp - avg_temp,0.0)
+    y = usage/days
+    total = lambda v: np.bincount(account,v,minlength=n)
+    count = total(np.ones_like(days))
+    sw, sx, sy = total(days), total(days*x), total(days*y)
+    sxx, sxy, syy = total(days*x*x), total(days*x*y), total(days*y*y)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        mean_x, mean_y = sx/sw, sy/sw
+        var_x = sxx/sw - mean_x**2
+        cov = sxy/sw - mean_x*mean_y
+        var_y = syy/sw - mean_y**2
+        fitted = (count >= min_fit_periods) & (var_x >= min_hdd_spread**2)
+        slope = np.where(fitted,cov/var_x,0.0)
+        baseload = np.where(sw > 0,mean_y - slope*mean_x,0.0)
+        # use cannot fall as it gets colder, and the baseload cannot be negative:
+        # refit through the origin when the intercept would go below zero
+        slope = np.maximum(slope,0.0)
+        baseload = np.where(slope > 0,baseload,np.nan_to_num(mean_y))
+        origin = baseload < 0
+        slope = np.where(origin,sxy/sxx,slope)
+        baseload = np.where(origin,0.0,baseload)
+        residual = syy - 2*baseload*sy - 2*slope*sxy + baseload**2*sw + 2*baseload*slope*sx + slope**2*sxx
+        r2 = np.where(fitted & (var_y > 0),1 - residual/(var_y*sw),0.0)
+    return HeatingFit(accounts,baseload,slope,r2,count.astype(np.int64),
+                      typical_hdd(account,days,x,end,n))
+
+# function to return the typical-year heating degree days per account
+#   average HDD / day per calendar month of the bills' midpoints, times the days in the month
+def typical_hdd(account,days,x,end,n):
+    mid = end - (days/2).astype('timedelta64[D]')
+    month = mid.astype('datetime64[M]').astype(np.int64) % 12
+    cell = account*12 + month
+    month_days_seen = np.bincount(cell,days,minlength=n*12).reshape(n,12)
+    month_hdd = np.bincount(cell,days*x,minlength=n*12).reshape(n,12)
+    fleet_days, fleet_hdd = month_days_seen.sum(axis=0), month_hdd.sum(axis=0)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        fleet = np.where(fleet_days > 0,fleet_hdd/fleet_days,0.0)
+        daily = np.where(month_days_seen > 0,month_hdd/month_days_seen,fleet)
+    return daily @ month_days
+
+# function to fit the heating model from gas billing periods (Climate_bills.BillPeriod)
+def fit_periods(periods):
+    gas = [p for p in periods if p.kind == 'gas']
+    accounts = sorted({p.account for p in gas})
+    code = {a:i for i,a in enumerate(accounts)}
+    nan = lambda v: np.nan if v is None else v
+    return fit_heating([code[p.account] for p in gas],[p.days for p in gas],
+                       [nan(p.usage) for p in gas],[nan(p.avg_temp) for p in gas],
+                       np.array([p.end for p in gas],dtype='datetime64[D]'),accounts)
+
+# function to fit the heating model for every account in a Climate_history.HistoryStore
+def fit_store(store):
+    cols = store.periods()
+    gas = cols['kind'] == list(bills.bill_units).index('gas')
+    return fit_heating(cols['account'][gas],cols['days'][gas],cols['usage'][gas],cols['avg_temp'][gas],
+                       cols['end'][gas],list(store.accounts))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit the weather-normalized heating model per gas account')
+    parser.add_argument('exports',nargs='*',help='gas usage exports')
+    parser.add_argument('--store',help='Climate_history store directory to fit instead')
+    args = parser.parse_args()
+    if args.store:
+        import Climate_history
+        fit = fit_store(Climate_history.HistoryStore(args.store))
+    else:
+        fit = fit_periods(bills.merge_bills(*(bills.read_bills(path) for path in args.exports)))
+    print('account,' + ','.join(fit_fields))
+    for i,account in enumerate(fit.accounts):
+        if fit.periods[i]:
+            print('%s,' % account + ','.join('%.4g' % getattr(fit,k)[i] for k in fit_fields))
+    if not len(fit):
+        sys.exit('no gas billing periods')
@@ -0,0 +1,301 @@
+# Climate Dashboard footprint history
+#   turns utility bill series into weekly kWh / ccf and the matching watts and kg-CO2 per
+#   HH member for the household electric and natural gas categories, week by week
+#
+#   bills are kept in an append-only columnar store: a directory with one .npz segment per
+#   append and a history.json manifest listing the accounts and segments in order
+#     segment columns   period rows: account, kind, start, end (days since 1970-01-01),
+#                       days, usage, amount, avg_temp
+#                       week rows: row (period row in the segment), week, days, usage,
+#                       each billing period split over the Monday-based weeks it covers
+#   appending bills only splits the periods that are not stored yet (same account, kind and
+#   read date) and adds them to the in-memory weekly totals, so a new month costs the same
+#   whether the history holds one year or twenty; compact() merges the segments into one
+#   bills of an export without an account number go to the stored account of the same kind,
+#   and a stored unnamed account takes the account number of later exports
+#
+#   usage: python Climate_history.py STORE [<export> ...] [--zip N] [--pop N]
+#          appends the exports to the store and prints the weekly timeline as CSV
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+import Climate_bills as bills
+import Climate_fx as cf
+import Climate_metrics as metrics
+
+# footprint categories covered by the bills, by bill kind
+history_categories = {'electric':'HH Elec Grid','gas':'HH NatGas Usage'}
+bill_kinds = list(bills.bill_units)
+
+# weeks start on Mondays: day numbers count from 1970-01-01, a Thursday
+week_offset = 3
+epoch_ordinal = 719163          # datetime.date(1970,1,1).toordinal()
+
+manifest_file = 'history.json'
+period_columns = ['account','kind','start','end','days','usage','amount','avg_temp']
+week_columns = ['row','week','days','usage']
+
+
+# function to return the Monday starting each week number
+def week_dates(weeks):
+    return (np.asarray(weeks,dtype=np.int64)*7 - week_offset).astype('datetime64[D]')
+
+# function to convert billing periods to period columns, coding accounts by their
+#   position in accounts (new accounts are appended to the list)
+def periods_to_columns(periods,accounts):
+    codes = {a:i for i,a in enumerate(accounts)}
+    account, kind, end, days, usage, amount, avg_temp = [], [], [], [], [], [], []
+    for p in periods:
+        if not p.days or p.usage is None:
+            continue
+        if p.account not in codes:
+            codes[p.account] = len(accounts)
+            accounts.append(p.account)
+        account.append(codes[p.account])
+        kind.append(bill_kinds.index(p.kind))
+        end.append(p.end.toordinal())
+        days.append(p.days)
+        usage.append(p.usage)
+        amount.append(np.nan if p.amount is None else p.amount)
+        avg_temp.append(np.nan if p.avg_temp is None else p.avg_temp)
+    end = np.asarray(end,dtype=np.int64) - epoch_ordinal
+    days = np.asarray(days,dtype=np.int64)
+    return {'account':np.asarray(account,dtype=np.int32),
+            'kind':np.asarray(kind,dtype=np.int8),
+            'start':end - days,
+            'end':end,
+            'days':days,
+            'usage':np.asarray(usage,dtype=np.float64),
+            'amount':np.asarray(amount,dtype=np.float64),
+            'avg_temp':np.asarray(avg_temp,dtype=np.float64)}
+
+# function to split billing periods over the weeks they cover, prorated by day
+#   start / end are day numbers (end exclusive, the read date); returns the week row columns
+def split_weeks(start,end,usage):
+    days = end - start
+    first = (start + week_offset) // 7
+    last = (end - 1 + week_offset) // 7
+    counts = last - first + 1
+    row = np.repeat(np.arange(len(start)),counts)
+    offsets = np.cumsum(counts) - counts
+    week = first[row] + np.arange(len(row)) - offsets[row]
+    monday = week*7 - week_offset
+    covered = np.minimum(end[row],monday + 7) - np.maximum(start[row],monday)
+    return {'row':row.astype(np.int32),
+            'week':week,
+            'days':covered,
+            'usage':usage[row]*covered/days[row]}
+
+# function to return a key per period that is unique for an account, kind and read date
+def period_keys(account,kind,end):
+    return (account.astype(np.int64)*len(bill_kinds) + kind)*2**32 + end
+
+
+# weekly electric and natural gas history for every account, with the matching footprint
+#   weeks holds the Monday of each week; kwh / ccf the household usage per week and
+#   watts / co2 map each history category to per HH member values, as on the charts
+#   weeks no bill covers are zero
+class Timeline:
+
+    def __init__(self,weeks,kwh,ccf,zipcoeff,pop):
+        self.weeks = weeks
+        self.kwh = kwh
+        self.ccf = ccf
+        self.zipcoeff = zipcoeff
+        self.pop = pop
+        self.watts = {'HH Elec Grid':kwh*cf.kwh_to_watts/pop,
+                      'HH NatGas Usage':ccf*cf.natgas_kwh_coeff*cf.kwh_to_watts/pop}
+        self.co2 = {'HH Elec Grid':kwh*zipcoeff/pop,
+                    'HH NatGas Usage':ccf*cf.natgas_co2_coeff/pop}
+
+    def __len__(self):
+        return len(self.weeks)
+
+
+# append-only store of billing periods with running weekly totals
+#   path is the store directory, created on the first append; None keeps the store in memory
+#   (one per dashboard session); a store has a single writer
+class HistoryStore:
+
+    def __init__(self,path=None):
+        self.path = path
+        self.accounts = []
+        self.segments = []
+        self._columns = []
+        self._keys = np.empty(0,dtype=np.int64)
+        self._pairs = set()         # (account code, kind code) of the stored periods
+        self._first_week = 0
+        self._usage = np.zeros((0,len(bill_kinds),0))
+        self._days = np.zeros((0,len(bill_kinds),0))
+        if path is not None and os.path.exists(os.path.join(path,manifest_file)):
+            with open(os.path.join(path,manifest_file)) as f:
+                manifest = json.load(f)
+            self.accounts = manifest['accounts']
+            for name in manifest['segments']:
+                with np.load(os.path.join(path,name)) as data:
+                    self._add_segment(name,{k:data[k] for k in data.files})
+
+    # number of stored billing periods
+    def __len__(self):
+        return len(self._keys)
+
+    # function to add billing periods (any iterable of Climate_bills.BillPeriod)
+    #   periods already in the store are skipped, so overlapping exports can be appended
+    #   again; returns the number of new periods
+    @metrics.timed('history_append')
+    def append(self,periods):
+        periods = bills.resolve_accounts(periods,self.account_kinds())
+        renamed = self._name_unnamed(periods)
+        accounts = list(self.accounts)
+        cols = periods_to_columns(periods,accounts)
+        keys = period_keys(cols['account'],cols['kind'],cols['end'])
+        # the last copy of a period repeated within the batch, none already stored
+        keys, last = np.unique(keys[::-1],return_index=True)
+        new = len(cols['end']) - 1 - last[~np.isin(keys,self._keys)]
+        if not len(new):
+            if renamed and self.path is not None:
+                self._write_manifest(self.segments)
+            return 0
+        new.sort()
+        segment = {k:v[new] for k,v in cols.items()}
+        weeks = split_weeks(segment['start'],segment['end'],segment['usage'])
+        segment.update({'week_' + k:v for k,v in weeks.items()})
+        self.accounts = accounts
+        name = self._next_segment()
+        if self.path is not None:
+            self._write(name,segment)
+        self._add_segment(name,segment)
+        return len(new)
+
+    # function to return the (account, kind) pairs of the stored periods
+    def account_kinds(self):
+        return {(self.accounts[a],bill_kinds[k]) for a,k in self._pairs}
+
+    # function to name a stored unnamed account after the one account number that new
+    #   periods give the same kinds (a combined export appended before the per-year ones)
+    #   returns True if the account was renamed
+    def _name_unnamed(self,periods):
+        if bills.unnamed_account not in self.accounts:
+            return False
+        stored = self.account_kinds()
+        kinds = {k for a,k in stored if a == bills.unnamed_account}
+        named = {p.account for p in periods if p.kind in kinds and p.account != bills.unnamed_account}
+        if len(named) != 1 or named & set(self.accounts) or any(k in kinds for a,k in stored if a != bills.unnamed_account):
+            return False
+        self.accounts[self.accounts.index(bills.unnamed_account)] = named.pop()
+        return True
+
+    # function to return the file name for the next segment, numbered after the last one
+    def _next_segment(self):
+        return 'segment-%05d.npz' % (int(self.segments[-1][8:13]) + 1 if self.segments else 0)
+
+    # function to add the weekly rows of one segment to the running totals
+    def _add_segment(self,name,segment):
+        self.segments.append(name)
+        self._columns.append(segment)
+        self._keys = np.concatenate([self._keys,period_keys(segment['account'],segment['kind'],segment['end'])])
+        self._pairs.update(zip(segment['account'].tolist(),segment['kind'].tolist()))
+        week = segment['week_week']
+        if not len(week):
+            return
+        rows = segment['week_row']
+        # grow the totals to cover any new accounts and weeks
+        held = self._usage.shape[2]
+        first, stop = week.min(), week.max() + 1
+        if held:
+            first, stop = min(first,self._first_week), max(stop,self._first_week + held)
+        shape = (len(self.accounts),len(bill_kinds),stop - first)
+        if shape != self._usage.shape:
+            before = self._first_week - first if held else 0
+            pad = [(0,shape[0] - self._usage.shape[0]),(0,0),(before,shape[2] - held - before)]
+            self._usage = np.pad(self._usage,pad)
+            self._days = np.pad(self._days,pad)
+            self._first_week = first
+        cell = np.ravel_multi_index((segment['account'][rows],segment['kind'][rows],week - first),shape)
+        self._usage += np.bincount(cell,segment['week_usage'],minlength=self._usage.size).reshape(shape)
+        self._days += np.bincount(cell,segment['week_days'],minlength=self._days.size).reshape(shape)
+
+    # function to write a segment, then the manifest that lists it
+    #   the manifest is replaced atomically, so an interrupted append leaves the store as it was
+    def _write(self,name,segment,segments=None):
+        os.makedirs(self.path,exist_ok=True)
+        np.savez(os.path.join(self.path,name),**segment)
+        self._write_manifest((self.segments + [name]) if segments is None else segments)
+
+    def _write_manifest(self,segments):
+        manifest = {'accounts':self.accounts,'segments':segments}
+        tmp = os.path.join(self.path,manifest_file + '.tmp')
+        with open(tmp,'w') as f:
+            json.dump(manifest,f,indent=1)
+        os.replace(tmp,os.path.join(self.path,manifest_file))
+
+    # function to return every stored billing period as columns, in append order
+    #   account is a position in accounts and kind a position in bill_kinds
+    def periods(self):
+        return {k:np.concatenate([c[k] for c in self._columns]) if self._columns else np.empty(0)
+                for k in period_columns}
+
+    # function to merge the segments into one file (in memory the totals are unchanged)
+    def compact(self):
+        if len(self.segments) < 2:
+            return
+        merged = {k:np.concatenate([c[k] for c in self._columns]) for k in period_columns}
+        offsets = np.cumsum([0] + [len(c['end']) for c in self._columns[:-1]])
+        merged['week_row'] = np.concatenate([c['week_row'] + o for c,o in zip(self._columns,offsets)])
+        for k in week_columns[1:]:
+            merged['week_' + k] = np.concatenate([c['week_' + k] for c in self._columns])
+        name = self._next_segment()
+        old = self.segments
+        if self.path is not None:
+            self._write(name,merged,[name])
+            for f in old:
+                os.remove(os.path.join(self.path,f))
+        self.segments = [name]
+        self._columns = [merged]
+
+    # function to return the weekly timeline of the household footprint
+    #   accounts (names) limits it to some accounts, default all; zip selects the grid
+    #   coefficient and pop the household size, as on the dashboard
+    #   each account's usage is scaled to a full week where its bills cover only part of one
+    @metrics.timed('history_timeline')
+    def timeline(self,zip=0,pop=1,accounts=None):
+        usage, days = self._usage, self._days
+        if accounts is not None:
+            rows = [self.accounts.index(a) for a in accounts]
+            usage, days = usage[rows], days[rows]
+        weekly = (np.divide(usage*7,days,out=np.zeros_like(usage),where=days > 0)).sum(axis=0)
+        weeks = week_dates(np.arange(self._first_week,self._first_week + usage.shape[2]))
+        return Timeline(weeks,weekly[bill_kinds.index('electric')],weekly[bill_kinds.index('gas')],
+                        cf.coeff_lookup(cf.zip_index(),zip),pop)
+
+
+# function to chart a timeline as weekly values stacked by category ('watts' or 'co2')
+def plot_history(timeline,by='co2'):
+    values = timeline.watts if by == 'watts' else timeline.co2
+    df = cf.plotting().DataFrame(values,index=timeline.weeks)
+    title = ('Weekly household energy power (W) per HH member' if by == 'watts'
+             else 'Weekly household energy CO2 emissions (kg) per HH member')
+    return df.hvplot.area(height=400,width=900,stacked=True,legend=True,title=title)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append bill exports to a footprint history and print it')
+    parser.add_argument('store',help='history store directory')
+    parser.add_argument('exports',nargs='*',help='electric / gas usage exports to append')
+    parser.add_argument('--zip',type=int,default=0,help='ZIP code for the grid coefficient')
+    parser.add_argument('--pop',type=int,default=1,help='adults in the household')
+    args = parser.parse_args()
+    store = HistoryStore(args.store)
+    added = store.append(bills.merge_bills(*(bills.read_bills(path) for path in args.exports)))
+    print('# %d new billing periods, %d stored' % (added,len(store)),file=sys.stderr)
+    tl = store.timeline(args.zip,args.pop)
+    print('week,kwh,ccf,elec_W,gas_W,elec_kgco2,gas_kgco2')
+    for i,week in enumerate(tl.weeks):
+        print('%s,%.1f,%.2f,%.1f,%.1f,%.2f,%.2f' % (week,tl.kwh[i],tl.ccf[i],
+                                                     tl.watts['HH Elec Grid'][i],tl.watts['HH NatGas Usage'][i],
+                                                     tl.co2['HH Elec Grid'][i],tl.co2['HH NatGas Usage'][i]))
@@ -0,0 +1,202 @@
+# Climate Dashboard metrics
+#   optional timing of the hot paths (lookups, footprint math, chart building, Bokeh patches
+#   and the dashboard callbacks) aggregated into per-name histograms, for capacity planning
+#
+#   switched by environment variables read at import time:
+#     CLIMATEDASH_METRICS           1 to time the instrumented functions; unset or 0 leaves
+#                                   them undecorated, so instrumentation costs nothing
+#     CLIMATEDASH_METRICS_PORT      serve the current snapshot as JSON on this local port
+#                                   (each server process takes the next free port upward)
+#     CLIMATEDASH_METRICS_INTERVAL  log the snapshot every this many seconds
+#     CLIMATEDASH_METRICS_SAMPLES   recent samples kept per histogram (default 10000)
+#
+#   usage: python Climate_metrics.py [URL]  prints the snapshot from a running server
+#          (default http://127.0.0.1:$CLIMATEDASH_METRICS_PORT/)
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+enabled = os.environ.get('CLIMATEDASH_METRICS','') not in ('','0')
+sample_size = int(os.environ.get('CLIMATEDASH_METRICS_SAMPLES',10000))
+default_port = int(os.environ.get('CLIMATEDASH_METRICS_PORT',0))
+default_interval = float(os.environ.get('CLIMATEDASH_METRICS_INTERVAL',0))
+default_address = '127.0.0.1'
+
+# function to return the metrics logger, imported on first use to keep Climate_fx imports light
+def logger():
+    import logging
+    return logging.getLogger('ClimateDash.metrics')
+
+
+# latency histogram over the most recent samples, with lifetime count, total and max
+class Histogram:
+
+    def __init__(self,name,size=sample_size):
+        self.name = name
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self,seconds):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    # count, mean and max over all samples, percentiles over the recent ones, in milliseconds
+    def stats(self):
+        with self._lock:
+            recent = sorted(self.samples)
+            count, total, longest = self.count, self.total, self.max
+        pct = lambda p: recent[min(len(recent)-1,int(len(recent)*p))]*1000 if recent else 0.0
+        return {'count':count,
+                'mean_ms':total/count*1000 if count else 0.0,
+                'p50_ms':pct(0.50),
+                'p95_ms':pct(0.95),
+                'p99_ms':pct(0.99),
+                'max_ms':longest*1000}
+
+    def clear(self):
+        with self._lock:
+            self.samples.clear()
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+histograms = {}
+counters = {}
+sources = {}
+_lock = threading.Lock()
+_started = False
+
+
+# function to return the histogram for a name, creating it on first use
+def histogram(name):
+    h = histograms.get(name)
+    if h is None:
+        with _lock:
+            h = histograms.setdefault(name,Histogram(name))
+    return h
+
+# function to add one sample in seconds to a histogram
+def record(name,seconds):
+    if enabled:
+        histogram(name).record(seconds)
+
+# function to add to a named event counter
+def increment(name,n=1):
+    if enabled:
+        with _lock:
+            counters[name] = counters.get(name,0) + n
+
+# decorator timing every call of a function into the histogram for name
+#   (default module.function); with metrics disabled the function is returned unchanged
+def timed(name=None):
+    def decorate(fn):
+        if not enabled:
+            return fn
+        h = histogram(name or '%s.%s' % (fn.__module__,fn.__qualname__))
+        @functools.wraps(fn)
+        def wrapper(*args,**kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args,**kwargs)
+            finally:
+                h.record(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+# function to register a callable whose result is included in every snapshot (e.g. cache stats)
+def add_source(name,fn):
+    sources[name] = fn
+
+# function to return all metrics of this process as a JSON-serializable dict
+def snapshot():
+    return {'pid':os.getpid(),
+            'time':time.time(),
+            'enabled':enabled,
+            'timings':{name:h.stats() for name,h in sorted(histograms.items())},
+            'counters':dict(counters),
+            **{name:fn() for name,fn in sources.items()}}
+
+# function to drop all recorded samples and counts
+def reset():
+    with _lock:
+        for h in histograms.values():
+            h.clear()
+        counters.clear()
+
+
+# function to serve snapshot() as JSON over HTTP from a daemon thread
+#   tries port, port+1, ... so every server process gets its own endpoint; returns the server
+def serve(port=default_port,address=default_address,attempts=64):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(snapshot(),indent=1).encode()
+            self.send_response(200)
+            self.send_header('Content-Type','application/json')
+            self.send_header('Content-Length',str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self,format,*args):
+            pass
+
+    for p in range(port,port+attempts):
+        try:
+            server = ThreadingHTTPServer((address,p),MetricsHandler)
+            break
+        except OSError:
+            continue
+    else:
+        raise OSError('no free metrics port in %d-%d' % (port,port+attempts-1))
+    threading.Thread(target=server.serve_forever,name='ClimateDash-metrics',daemon=True).start()
+    logger().info('metrics for process %d at http://%s:%d/',os.getpid(),address,server.server_address[1])
+    return server
+
+# function to log snapshot() as one JSON line every interval seconds from a daemon thread
+def log_periodically(interval=default_interval):
+    log = logger()
+    def dump():
+        while True:
+            time.sleep(interval)
+            log.info(json.dumps(snapshot()))
+    thread = threading.Thread(target=dump,name='ClimateDash-metrics-log',daemon=True)
+    thread.start()
+    return thread
+
+# function to start the configured endpoint and log dump once per process
+#   called from each server process, so forked workers report separately
+def start(port=default_port,interval=default_interval):
+    global _started
+    with _lock:
+        if _started or not enabled:
+            return
+        _started = True
+    import logging
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO)
+    if port:
+        serve(port)
+    if interval > 0:
+        log_periodically(interval)
+
+
+if __name__ == '__main__':
+    from urllib.request import urlopen
+    if len(sys.argv) < 2 and not default_port:
+        sys.exit('usage: python Climate_metrics.py URL (or set CLIMATEDASH_METRICS_PORT)')
+    url = sys.argv[1] if len(sys.argv) > 1 else 'http://%s:%d/' % (default_address,default_port)
+    with urlopen(url) as f:
+        print(json.dumps(json.load(f),indent=1))
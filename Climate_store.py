@@ -0,0 +1,206 @@
+# Climate Dashboard persistent results and share links
+#   keeps computed footprints in a local SQLite file, so input states seen before (by any
+#   visitor, server process or restart) load without recomputing, and encodes input states
+#   as compact URL query strings for links that reopen the dashboard in the same state
+#
+#   rows are keyed by a hash of the normalized inputs and the data version: a hash of the
+#   ZIP coefficient table, the vehicle table and the Climate_fx model coefficients, so
+#   editing zip_coefficients.csv, Vehicles_data.csv or a coefficient changes every key;
+#   rows of other data versions are deleted when the store is opened
+#
+#   enable for a server with CLIMATEDASH_RESULTS=<file> (python ClimateDash.py uses
+#   results.sqlite unless --results '' is given)
+#
+#   usage: python Climate_store.py STORE [QUERY ...]
+#          precomputes the default dashboard state and each share link query
+#          (e.g. 'v1=Hatchback-EV,50,12000&zip=10001') into STORE
+
+import hashlib
+import json
+import math
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+import numpy as np
+
+import Climate_fx as cf
+import Climate_metrics as metrics
+
+# query parameter for each input of a Household key after the vehicles; vehicles are
+#   v1..vN = model,% highway,miles, all listed when they differ from the defaults
+#   (v= alone for a household without vehicles)
+link_vehicle = 'v'
+link_inputs = ['pt','at','he','hg','zip','pop','hd','hdt']
+# accepted (lowest, highest) value of each query parameter, as on the dashboard widgets
+link_ranges = {'hwy':(0,100),'miles':(0,30000),
+               'pt':(0,20000),'at':(0,200),'he':(0,2000),'hg':(0,200),
+               'zip':(0,99999),'pop':(1,10),'hd':(1000,5000),'hdt':(1,6)}
+
+# Climate_fx coefficients the stored footprints depend on, hashed into the data version
+model_coefficient_names = ['natgas_co2_coeff','natgas_kwh_coeff','petrol_kwh_coeff','petrol_co2_coeff',
+                           'pubtrans_co2_coeff','pubtrans_fe','air_co2_coeff','air_fe_rate',
+                           'diet_co2_eq','diet_prod_mult','diet_kcal_to_kwh',
+                           'kwh_to_watts','month_to_week','year_to_week']
+
+_data_version = None
+
+
+# function to return the data version: a hash of the lookup tables and model coefficients
+#   the tables are hashed as loaded, so the browser build (shipped without the CSVs) and a
+#   server reading the CSVs agree on the version of the same data
+def data_version():
+    global _data_version
+    if _data_version is None:
+        digest = hashlib.sha1()
+        index = cf.zip_index()
+        digest.update(np.ascontiguousarray(index.codes).tobytes())
+        digest.update(np.ascontiguousarray(index.palette).tobytes())
+        catalog = cf.vehicle_catalog()
+        digest.update(json.dumps(list(catalog.models)).encode())
+        for values in (catalog.fe_city,catalog.fe_hwy,catalog.is_ev):
+            digest.update(np.ascontiguousarray(values).tobytes())
+        digest.update(json.dumps(model_coefficients(),sort_keys=True).encode())
+        _data_version = digest.hexdigest()[:16]
+    return _data_version
+
+# function to return the model coefficients of Climate_fx by name
+#   an explicit list, so settings such as the cache size or layout constants do not change
+#   the version (a store deletes the rows of every other version)
+def model_coefficients():
+    return {k:getattr(cf,k) for k in model_coefficient_names}
+
+# function to return the store key for a Household key
+def result_key(key,version=None):
+    return hashlib.sha1(json.dumps([version or data_version(),key]).encode()).hexdigest()
+
+# function to convert a footprint to JSON text and back
+def footprint_json(fp):
+    return json.dumps({'zipcoeff':fp.zipcoeff,
+                       'pop':fp.pop,
+                       'vehicles':{k:v.tolist() for k,v in fp.vehicles.items()},
+                       'household':fp.household,
+                       'watts':fp.watts,
+                       'co2':fp.co2})
+
+def footprint_from_json(text,key=None):
+    d = json.loads(text)
+    vehicles = {k:np.array(v) for k,v in d['vehicles'].items()}
+    for v in vehicles.values():
+        v.setflags(write=False)
+    return cf.Footprint(d['zipcoeff'],d['pop'],vehicles,d['household'],d['watts'],d['co2'],key=key)
+
+
+# footprints stored in a SQLite file, shared by every process that opens it
+#   safe to use from several threads; writes are committed one by one, so a crashed
+#   server loses nothing already computed (sqlite3 is imported here, as Pyodide ships it
+#   separately and the browser build only needs the share links)
+class ResultStore:
+
+    def __init__(self,path,version=None):
+        self.path = path
+        self.version = version or data_version()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        import sqlite3
+        self._db = sqlite3.connect(path,timeout=30,check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results ('
+                             'key TEXT PRIMARY KEY, version TEXT, inputs TEXT, footprint TEXT, created REAL)')
+            self._db.execute('DELETE FROM results WHERE version != ?',(self.version,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    # function to return the stored footprint for a Household key, or None
+    @metrics.timed('result_store_get')
+    def get(self,key):
+        with self._lock:
+            row = self._db.execute('SELECT footprint FROM results WHERE key = ?',
+                                   (result_key(key,self.version),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return footprint_from_json(row[0],key)
+
+    # function to store the footprint for a Household key
+    @metrics.timed('result_store_put')
+    def put(self,key,fp):
+        text = footprint_json(fp)
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO results VALUES (?,?,?,?,?)',
+                             (result_key(key,self.version),self.version,json.dumps(key),text,time.time()))
+
+    def stats(self):
+        return {'name':'results','path':self.path,'version':self.version,
+                'hits':self.hits,'misses':self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# function to encode a Household key as a URL query, leaving out inputs equal to defaults
+def state_query(key,defaults=None):
+    params = []
+    vehicles = key[0]
+    if defaults is None or vehicles != defaults[0]:
+        params += [('%s%d' % (link_vehicle,i + 1),'%s,%s,%s' % v) for i,v in enumerate(vehicles)]
+        if not vehicles:
+            params.append((link_vehicle,''))
+    for i,name in enumerate(link_inputs,1):
+        if defaults is None or key[i] != defaults[i]:
+            params.append((name,key[i]))
+    return urlencode(params,safe=',')
+
+# function to convert a query value to a key number, ValueError unless finite and in range
+def link_number(value,name):
+    number = float(value)
+    low, high = link_ranges[name]
+    if not (math.isfinite(number) and low <= number <= high):
+        raise ValueError('%s out of range: %r' % (name,value))
+    return cf.key_number(number)
+
+# function to decode a URL query into a Household key
+#   inputs missing from the query, that do not parse or are outside link_ranges take their
+#   default; vehicles naming an unknown model or out of range are left out
+def query_state(query,defaults):
+    state = list(defaults)
+    params = dict(parse_qsl(query.lstrip('?'),keep_blank_values=True))
+    catalog = cf.vehicle_catalog()
+    numbered = sorted((int(name[len(link_vehicle):]),value) for name,value in params.items()
+                      if name.startswith(link_vehicle) and name[len(link_vehicle):].isdigit())
+    if numbered or link_vehicle in params:
+        vehicles = []
+        for i,value in numbered:
+            try:
+                model, hwy, miles = value.rsplit(',',2)
+                if model in catalog:
+                    vehicles.append((model,link_number(hwy,'hwy'),link_number(miles,'miles')))
+            except ValueError:
+                pass
+        state[0] = tuple(vehicles)
+    for i,name in enumerate(link_inputs,1):
+        try:
+            state[i] = link_number(params[name],name)
+        except (KeyError,ValueError):
+            pass
+    return tuple(state)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: python Climate_store.py STORE [QUERY ...]')
+    store = ResultStore(sys.argv[1])
+    cf.set_result_store(store)
+    import ClimateDash
+    defaults = ClimateDash.create_session().updater.values()[0].key
+    for query in [''] + sys.argv[2:]:
+        key = query_state(query,defaults)
+        cf.cached_footprint(cf.Household.from_key(key))
+        print('%s  %s' % (result_key(key)[:12],state_query(key,defaults) or '(defaults)'))
+    print('# %d results stored for data version %s' % (len(store),store.version))
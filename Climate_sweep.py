@@ -0,0 +1,153 @@
+# Climate Dashboard scenario sweeps
+#   evaluates a grid of what-if scenarios around one household in a single array pass:
+#   every vehicle model x annual mileage for one of its vehicles, x diet types, x ZIP codes
+#   each swept input gets its own array axis and the footprint model broadcasts them,
+#   so a category is only computed over the axes it depends on (diet never sees the ZIPs)
+#
+#   usage:
+#     s = sweep(household, slot=1, mileages=range(0,30001,1000), zips=[43017,10001])
+#     s = sweep(*dashboard_inputs, slot=1)   the same from the flat four-vehicle inputs
+#     s.ranked(10)          10 lowest-emission scenarios with savings and distance to target
+#     plot_sweep(s)         stacked comparison chart of the baseline and the best scenarios
+
+import numpy as np
+
+import Climate_fx as cf
+import Climate_metrics as metrics
+
+# dashboard inputs in the order taken by compute_footprint / cached_footprint, with defaults
+input_names = ['t1','h1','m1','t2','h2','m2','t3','h3','m3','t4','h4','m4',
+               'pt','at','he','hg','zip','pop','hd','hdt']
+input_defaults = {'zip':0,'pop':2,'hd':2000,'hdt':4}
+
+# value ranked on and the matching weekly per HH member target for each measure
+sweep_measures = {'watts':cf.weekly_target_W,'co2':cf.weekly_target_CO2}
+
+
+# grid of evaluated scenarios
+#   base is the baseline Household and baseline its Footprint
+#   models, mileages, diets (diet types 1-6, as Household.hdt) and zips are the swept values,
+#   in axis order
+#   watts / co2 map each category to per HH member values broadcastable to shape, and
+#   total_watts / total_co2 are the (models, mileages, diets, zips) totals
+class Sweep:
+
+    def __init__(self,base,slot,models,mileages,diets,zips,watts,co2):
+        self.base = base
+        self.slot = slot
+        self.models = models
+        self.mileages = mileages
+        self.diets = diets
+        self.zips = zips
+        self.shape = (len(models),len(mileages),len(diets),len(zips))
+        self.watts = watts
+        self.co2 = co2
+        self.total_watts = np.broadcast_to(sum(watts.values()),self.shape)
+        self.total_co2 = np.broadcast_to(sum(co2.values()),self.shape)
+        self.baseline = cf.household_footprint(base)
+
+    def __len__(self):
+        return int(np.prod(self.shape))
+
+    # total per HH member for a measure ('watts' or 'co2')
+    def totals(self,by='co2'):
+        if by not in sweep_measures:
+            raise ValueError('by must be one of %s, not %r' % (', '.join(sweep_measures),by))
+        return self.total_watts if by == 'watts' else self.total_co2
+
+    # the swept inputs of the scenarios at flat indexes i
+    def scenarios(self,i):
+        m,k,d,z = np.unravel_index(i,self.shape)
+        return [{'model':self.models[a],
+                 'mileage':int(self.mileages[b]),
+                 'diet':cf.diet_names[self.diets[c] - 1],
+                 'zip':int(self.zips[e])} for a,b,c,e in zip(m,k,d,z)]
+
+    # per category values of one measure for the scenarios at flat indexes i
+    def categories(self,i,by='co2'):
+        idx = np.unravel_index(i,self.shape)
+        values = self.watts if by == 'watts' else self.co2
+        return {c:np.broadcast_to(v,self.shape)[idx] for c,v in values.items()}
+
+    # the n scenarios with the lowest total for a measure, best first
+    #   each carries its swept inputs, both totals, the weekly savings against the baseline
+    #   household (positive is better) and the amount over each target (negative is under)
+    def ranked(self,n=10,by='co2'):
+        totals = self.totals(by).ravel()
+        n = min(n,totals.size)
+        best = np.argpartition(totals,n-1)[:n] if n < totals.size else np.arange(totals.size)
+        best = best[np.argsort(totals[best],kind='stable')]
+        watts = self.total_watts.ravel()[best]
+        co2 = self.total_co2.ravel()[best]
+        rows = self.scenarios(best)
+        for row,w,c,i in zip(rows,watts,co2,best):
+            row.update({'index':int(i),
+                        'watts':float(w),
+                        'co2':float(c),
+                        'watts_saved':self.baseline.total_watts - float(w),
+                        'co2_saved':self.baseline.total_co2 - float(c),
+                        'watts_over_target':float(w) - cf.weekly_target_W,
+                        'co2_over_target':float(c) - cf.weekly_target_CO2})
+        return rows
+
+
+# function to evaluate every combination of the swept inputs around a baseline household
+#   args / kwargs are a Household or the dashboard inputs, as for cached_footprint
+#   slot is the vehicle (1..V) whose model and mileage are swept; models defaults to every
+#   vehicle in the catalog, diets to every diet type (dashboard diet types 1-6 or names), and
+#   mileages and zips to the baseline values
+@metrics.timed('sweep')
+def sweep(*args,slot=1,models=None,mileages=None,diets=None,zips=None,**kwargs):
+    if len(args) == 1 and isinstance(args[0],cf.Household):
+        household = args[0]
+    else:
+        base = dict(input_defaults)
+        base.update(zip(input_names,args))
+        base.update(kwargs)
+        missing = [k for k in input_names if k not in base]
+        if missing:
+            raise TypeError('sweep() missing inputs: %s' % ', '.join(missing))
+        household = cf.Household.from_inputs(*(base[k] for k in input_names))
+    if not 1 <= slot <= len(household.vehicles):
+        raise ValueError('slot must be 1-%d, not %r' % (len(household.vehicles),slot))
+    catalog = cf.vehicle_catalog()
+    idx, miles, pct_hwy = household.vehicle_arrays()
+    models = list(catalog.models) if models is None else list(models)
+    mileages = np.asarray(miles[0,slot-1:slot] if mileages is None else list(mileages),dtype=np.float64)
+    diets = range(1,len(cf.diet_names) + 1) if diets is None else diets
+    diets = np.asarray([cf.diet_names.index(d) + 1 if isinstance(d,str) else int(d) for d in diets])
+    if not ((diets >= 1) & (diets <= len(cf.diet_names))).all():
+        raise ValueError('diet types must be 1-%d' % len(cf.diet_names))
+    zips = np.asarray([household.zip] if zips is None else list(zips))
+    v = slot - 1
+    n = idx.shape[-1]
+    # axes: model, mileage, diet, zip, then the household's vehicles
+    veh_idx = np.empty((len(models),1,1,1,n),dtype=np.intp)
+    veh_idx[...] = idx[0]
+    veh_idx[:,0,0,0,v] = catalog.indices(models)
+    mileage = np.empty((1,len(mileages),1,1,n))
+    mileage[...] = miles[0]
+    mileage[0,:,0,0,v] = mileages
+    pt, at, he, hg = household.totals()
+    zipcoeff = cf.coeff_lookup_many(cf.zip_index(),zips).reshape(1,1,1,-1)
+    res = cf.footprint_arrays(veh_idx,mileage,pct_hwy[0],pt,at,he,hg,
+                              zipcoeff,household.pop,household.hd,diets.reshape(1,1,-1,1))
+    return Sweep(household,slot,models,mileages,diets,zips,res['watts'],res['co2'])
+
+# function to chart the baseline household against the n best scenarios of a sweep
+#   stacked by category like the dashboard charts, with the target as the last bar
+def plot_sweep(result,n=10,by='co2'):
+    best = result.ranked(n,by)
+    values = result.categories([row['index'] for row in best],by)
+    baseline = result.baseline.watts if by == 'watts' else result.baseline.co2
+    target_name = '2000-W Target' if by == 'watts' else 'Global Target'
+    consumption = {c:np.concatenate([[baseline[c]],values[c],[0]]) for c in cf.footprint_categories}
+    consumption[target_name] = np.concatenate([np.zeros(len(best)+1),[sweep_measures[by]]])
+    condf = cf.plotting().DataFrame(consumption)
+    condf.index = (['Your\nUsage\n'] +
+                   ['%s\n%d mi\n%s\n%05d' % (r['model'],r['mileage'],r['diet'],r['zip']) for r in best] +
+                   ['Target\n'])
+    title = ('Total Power Consumption (W) per HH member' if by == 'watts'
+             else 'Weekly CO2 emissions (kg) per HH member')
+    return condf.hvplot.bar(height=600,width=max(400,90*(len(best)+2)),legend=True,stacked=True,
+                            rot=90,title=title + ': best scenarios')
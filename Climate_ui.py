@@ -0,0 +1,554 @@
+# Climate Dashboard session helpers
+#   building blocks used by ClimateDash.py for each browser session
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from functools import partial
+from urllib.parse import urlencode
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import panel as pn
+import param
+import numpy as np
+from bokeh.models import ColumnDataSource, HoverTool, LinearColorMapper, Span
+from bokeh.palettes import Category10, Viridis256
+from bokeh.plotting import figure
+
+import Climate_fx as cf
+import Climate_history as ch
+import Climate_metrics as metrics
+import Climate_store as store
+
+# vehicle added by the dashboard's add button, and the most vehicle rows one session shows
+default_vehicle = ('SUV-Compact-ICE',50,0)
+max_vehicle_rows = 20
+
+# how dashboard inputs trigger recomputation, set per deployment with environment variables
+#   CLIMATEDASH_UPDATE_MODE  'throttle' (default): at most CLIMATEDASH_UPDATE_RATE updates per
+#                            second while dragging, pending changes coalesced, the final
+#                            state computed as soon as the slider is released
+#                            'release': sliders only recompute when released
+#                            'immediate': recompute on every event
+#   CLIMATEDASH_UPDATE_RATE  updates per second in throttle mode (default 4)
+update_modes = ('throttle','release','immediate')
+default_update_mode = os.environ.get('CLIMATEDASH_UPDATE_MODE','throttle')
+default_update_rate = float(os.environ.get('CLIMATEDASH_UPDATE_RATE',4))
+
+# where footprint computations run while a server session waits for them
+#   CLIMATEDASH_EXECUTOR  'thread' (default), 'process' or 'none' (run on the event loop)
+#   CLIMATEDASH_WORKERS   pool size shared by all sessions in the process (default 4)
+#   Pyodide has no threads, so the browser build always computes inline
+executor_kinds = ('thread','process','none')
+default_executor = os.environ.get('CLIMATEDASH_EXECUTOR','none' if sys.platform == 'emscripten' else 'thread')
+default_workers = int(os.environ.get('CLIMATEDASH_WORKERS',4))
+_executor = None
+
+log = logging.getLogger('ClimateDash')
+
+
+# function to set a slider to the nearest step, clipped to its range
+#   also counts as a release, so the update policy treats it as a final value
+def set_slider(slider,value):
+    steps = round((value - slider.start) / slider.step)
+    value = int(min(max(slider.start + steps*slider.step,slider.start),slider.end))
+    with param.edit_constant(slider):
+        slider.param.update(value=value,value_throttled=value)
+
+# function to set any dashboard input, ignoring values a select does not offer
+def set_input(widget,value):
+    if isinstance(widget,pn.widgets.IntSlider):
+        set_slider(widget,value)
+    elif isinstance(widget,pn.widgets.Select):
+        if value in widget.values:
+            widget.value = value
+    else:
+        widget.value = value
+
+
+# stacked bar chart that is built once per session and then updated in place
+#   each update patches only the bar values that changed into the ColumnDataSource,
+#   so the browser receives a small patch instead of a whole new plot document
+#   the first bar is the user's usage stacked by category, the second is the target
+class StackedBarChart:
+
+    def __init__(self,title,labels,target_name,target_value,
+                 categories=cf.footprint_categories,height=600,width=400):
+        self.categories = list(categories)
+        self.labels = list(labels)
+        data = {'x':self.labels}
+        for c in self.categories:
+            data[c] = [0.0,0.0]
+        data[target_name] = [0.0,float(target_value)]
+        self.source = ColumnDataSource(data)
+        stack = self.categories + [target_name]
+        self.figure = figure(x_range=self.labels,height=height,width=width,title=title,
+                             toolbar_location=None,tools='')
+        self.figure.vbar_stack(stack,x='x',width=0.8,source=self.source,
+                               color=Category10[10][:len(stack)],legend_label=stack)
+        self.figure.add_tools(HoverTool(tooltips=[('','$name'),('value','@$name{0.0}')]))
+        self.figure.y_range.start = 0
+        self.figure.xgrid.grid_line_color = None
+        self.figure.legend.location = 'top_right'
+        self.figure.legend.label_text_font_size = '8pt'
+        self.pane = pn.pane.Bokeh(self.figure)
+
+    # set the usage bar from a {category: value} dict, patching only changed values
+    #   in a server session the timing includes serializing the patch message for the browser
+    @metrics.timed('bokeh_patch')
+    def update(self,values):
+        patches = {}
+        for c in self.categories:
+            value = float(values.get(c,0.0))
+            if self.source.data[c][0] != value:
+                patches[c] = [(0,value)]
+        if patches:
+            self.source.patch(patches)
+
+# function to create the per-session power chart
+def power_chart():
+    return StackedBarChart('Total Power Consumption (W) per HH member',
+                           ['Your\nUsage\n','2000-W\nTarget\n'],
+                           '2000-W Target',cf.weekly_target_W)
+
+# function to create the per-session CO2 emissions chart
+def emissions_chart():
+    return StackedBarChart('Weekly CO2 emissions (kg) per HH member',
+                           ['Your\nUsage\n','2.5t kg-CO2/year\nTarget\n'],
+                           'Global Target',cf.weekly_target_CO2)
+
+
+# national grid coefficient view: where the user's ZIP sits among every rated US ZIP code
+#   built per session from the precomputed statistics shared by the process; the histogram,
+#   state bars and ZIP image never change, a new ZIP only moves the markers and the summary
+#   every ZIP is drawn as one pixel of a single image glyph (3-digit prefix by last two
+#   digits) colored by palette code, so the whole country renders as one small uint8 array
+class GridCoeffView:
+
+    def __init__(self,stats=None,width=450):
+        self.stats = stats = stats or cf.zip_stats()
+        palette = stats.index.palette
+        low, high = float(palette[1:].min()), float(palette[1:].max())
+        # national histogram with a marker at the user's coefficient
+        edges = stats.hist_edges
+        self.hist = figure(height=300,width=width,toolbar_location=None,tools='',
+                           title='US ZIP codes by grid coefficient (kg-CO2 / kWh)')
+        self.hist.quad(left=edges[:-1],right=edges[1:],top=stats.hist_counts,bottom=0,
+                       color='grey',line_color='white')
+        self.marker = Span(location=stats.index.default,dimension='height',line_color='red',line_width=2)
+        self.hist.add_layout(self.marker)
+        # mean coefficient per state, lowest first, with the user's state highlighted
+        order = [i for i in np.argsort(stats.state_mean) if stats.state_count[i] > 0]
+        self.state_rows = {str(stats.states[i]):row for row,i in enumerate(order)}
+        self.state_source = ColumnDataSource({'state':[str(stats.states[i]) for i in order],
+                                              'mean':stats.state_mean[order],
+                                              'count':stats.state_count[order],
+                                              'color':['grey']*len(order)})
+        self.states = figure(y_range=list(self.state_source.data['state']),height=700,width=width,
+                             toolbar_location=None,tools='',
+                             title='Mean grid coefficient by state (kg-CO2 / kWh)')
+        self.states.hbar(y='state',right='mean',height=0.8,color='color',source=self.state_source)
+        self.states.add_tools(HoverTool(tooltips=[('state','@state'),('mean','@mean{0.000}'),('ZIPs','@count')]))
+        self.states.x_range.start = 0
+        self.state = None
+        # every ZIP code, colored by its coefficient, unrated ZIPs transparent
+        colors = ['rgba(0,0,0,0)'] + [Viridis256[int((p - low) / (high - low or 1) * 255)] for p in palette[1:]]
+        mapper = LinearColorMapper(palette=colors,low=-0.5,high=len(colors)-0.5)
+        self.raster = figure(x_range=(0,100),y_range=(0,1000),height=700,width=width,
+                             toolbar_location=None,tools='',
+                             title='Every ZIP code: prefix (up) by last two digits (across)')
+        self.raster.image(image=[stats.code_grid()],x=0,y=0,dw=100,dh=1000,color_mapper=mapper)
+        self.zip_source = ColumnDataSource({'x':[0.5],'y':[0.5]})
+        self.raster.scatter('x','y',source=self.zip_source,size=12,fill_color=None,line_color='red',line_width=2)
+        self.summary = pn.pane.Markdown('',width=width)
+        self.pane = pn.Column(self.summary,
+                              pn.Row(pn.Column(pn.pane.Bokeh(self.hist),pn.pane.Bokeh(self.states)),
+                                     pn.pane.Bokeh(self.raster)))
+
+    # move the markers and summary to a ZIP code (anything else shows the national default)
+    def update(self,zip):
+        stats = self.stats
+        coeff = stats.index.lookup(zip)
+        try:
+            z = int(zip)
+        except (TypeError,ValueError):
+            z = -1
+        known = 0 <= z < len(stats.index.codes)
+        self.marker.location = coeff
+        self.zip_source.data = {'x':[z % 100 + 0.5],'y':[z // 100 + 0.5]} if known else {'x':[],'y':[]}
+        state = stats.state_of(z) if known else None
+        patches = []
+        if self.state in self.state_rows:
+            patches.append((self.state_rows[self.state],'grey'))
+        if state in self.state_rows:
+            patches.append((self.state_rows[state],'red'))
+        if patches:
+            self.state_source.patch({'color':patches})
+        self.state = state
+        if not known:
+            self.summary.object = '**Not a ZIP code: national default %.4f kg-CO2 / kWh**' % coeff
+            return
+        lines = ['**ZIP %05d: %.4f kg-CO2 / kWh**%s, higher than %.0f%% of %d rated US ZIP codes'
+                 % (z,coeff,'' if stats.index.codes[z] else ' (not rated, national default)',
+                    stats.percentile_of(z),stats.count)]
+        prefix = stats.zip3_summary(z)
+        if prefix['count']:
+            lines.append('ZIP codes %sxx: mean %.4f, range %.4f - %.4f (%d ZIPs)'
+                         % (prefix['prefix'],prefix['mean'],prefix['min'],prefix['max'],prefix['count']))
+        summary = stats.state_summary(state)
+        if summary and summary['count']:
+            lines.append('%s: mean %.4f, range %.4f - %.4f (%d ZIPs)'
+                         % (state,summary['mean'],summary['min'],summary['max'],summary['count']))
+        self.summary.object = '  \n'.join(lines)
+
+
+# weekly history of the household electric and natural gas emissions from a HistoryStore
+#   stacked by category in the bar chart colors; a new bill usually only changes the last
+#   weeks, so those are patched and the weeks after the old end streamed to the browser
+class HistoryChart:
+
+    def __init__(self,by='co2',height=400,width=900):
+        self.by = by
+        self.categories = list(ch.history_categories.values())
+        colors = [Category10[10][cf.footprint_categories.index(c)] for c in self.categories]
+        self.source = ColumnDataSource({'week':np.empty(0,dtype='datetime64[ms]'),
+                                        **{c:np.empty(0) for c in self.categories}})
+        title = ('Weekly household energy power (W) per HH member' if by == 'watts'
+                 else 'Weekly household energy CO2 emissions (kg) per HH member')
+        self.figure = figure(x_axis_type='datetime',height=height,width=width,title=title,
+                             toolbar_location=None,tools='')
+        self.figure.varea_stack(self.categories,x='week',source=self.source,color=colors,
+                                legend_label=self.categories)
+        self.figure.y_range.start = 0
+        self.figure.legend.location = 'top_left'
+        self.figure.legend.label_text_font_size = '8pt'
+        self.pane = pn.pane.Bokeh(self.figure)
+
+    # show the timeline of a store for a ZIP code and household size
+    @metrics.timed('bokeh_history')
+    def update(self,store,zip=0,pop=1):
+        timeline = store.timeline(zip,pop)
+        values = timeline.watts if self.by == 'watts' else timeline.co2
+        data = {'week':timeline.weeks.astype('datetime64[ms]'),**values}
+        old = self.source.data
+        n = len(old['week'])
+        if not n or n > len(timeline) or (old['week'][:n] != data['week'][:n]).any():
+            self.source.data = data
+            return
+        patches = {}
+        for c in self.categories:
+            changed = np.flatnonzero(old[c] != values[c][:n])
+            if len(changed):
+                patches[c] = [(int(i),float(values[c][i])) for i in changed]
+        if patches:
+            self.source.patch(patches)
+        if len(timeline) > n:
+            self.source.stream({k:v[n:] for k,v in data.items()})
+
+
+# one vehicle of the dashboard: model, % highway and annual mileage inputs, the vehicle's
+#   weekly readouts and a button removing it
+class VehicleRow:
+
+    def __init__(self,number,vehicle=default_vehicle):
+        model, hwy, miles = vehicle
+        self.type = pn.widgets.Select(name='Vehicle #%d Type' % number,options=cf.veh_list,value=model)
+        self.hwy = pn.widgets.IntSlider(name='% Highway Driving',value=hwy,start=0,end=100,step=5)
+        self.miles = pn.widgets.IntSlider(name="Annual Mileage",value=miles,start=0,end=30000,step=1000)
+        self.fuel = pn.widgets.StaticText(name = "Vehicle weekly fuel (gal)")
+        self.energy = pn.widgets.StaticText(name = "Vehicle weekly energy (kWh)")
+        self.co2 = pn.widgets.StaticText(name = "Indirect weekly emissions (kg CO2)")
+        self.remove = pn.widgets.Button(name='Remove vehicle',button_type='light',width=140)
+        self.inputs = [self.type,self.hwy,self.miles]
+        self.pane = pn.Column(self.type,self.hwy,self.miles,self.fuel,self.energy,self.co2,self.remove,
+                              pn.layout.Spacer(height=30))
+
+    def value(self):
+        return (self.type.value,self.hwy.value,self.miles.value)
+
+    def set(self,vehicle):
+        for w,value in zip(self.inputs,vehicle):
+            if w.value != value:
+                set_input(w,value)
+
+    def number(self,number):
+        self.type.name = 'Vehicle #%d Type' % number
+
+    # show the readouts of vehicle i of a footprint (blank if it was computed without it)
+    def show(self,fp,i):
+        known = i < len(fp.vehicles['gal'])
+        self.fuel.value = fp.vehicles['gal'][i] if known else ''
+        self.energy.value = fp.vehicles['kwh'][i] if known else ''
+        self.co2.value = fp.vehicles['co2'][i] if known else ''
+
+# the household's vehicles as rows that can be added and removed
+#   rows added or removed are watched / unwatched by the updater given to follow(),
+#   which then recomputes; pane holds the rows and the add button
+class VehicleList:
+
+    def __init__(self,vehicles=(),max_rows=max_vehicle_rows):
+        self.rows = []
+        self.max_rows = max_rows
+        self.updater = None
+        self.add_button = pn.widgets.Button(name='Add vehicle',button_type='primary',width=140)
+        self.add_button.on_click(lambda event: self.add())
+        self.pane = pn.Column()
+        for vehicle in vehicles:
+            self.add(vehicle)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # the input widgets of every row
+    def inputs(self):
+        return [w for row in self.rows for w in row.inputs]
+
+    # (model, % highway, annual miles) of every row
+    def values(self):
+        return [row.value() for row in self.rows]
+
+    def follow(self,updater):
+        self.updater = updater
+
+    def add(self,vehicle=default_vehicle):
+        if len(self.rows) >= self.max_rows:
+            return None
+        row = VehicleRow(len(self.rows) + 1,vehicle)
+        row.remove.on_click(lambda event: self.remove(row))
+        self.rows.append(row)
+        self.layout()
+        if self.updater is not None:
+            self.updater.watch(row.inputs)
+            self.updater.released()
+        return row
+
+    def remove(self,row):
+        self.rows.remove(row)
+        for i,r in enumerate(self.rows):
+            r.number(i + 1)
+        self.layout()
+        if self.updater is not None:
+            self.updater.unwatch(row.inputs)
+            self.updater.released()
+
+    # match the rows to a list of vehicles, adding or removing rows at the end
+    def set(self,vehicles):
+        vehicles = list(vehicles)[:self.max_rows]
+        while len(self.rows) > len(vehicles):
+            self.remove(self.rows[-1])
+        for row,vehicle in zip(self.rows,vehicles):
+            row.set(vehicle)
+        for vehicle in vehicles[len(self.rows):]:
+            self.add(vehicle)
+
+    def show(self,fp):
+        for i,row in enumerate(self.rows):
+            row.show(fp,i)
+
+    def layout(self):
+        self.add_button.disabled = len(self.rows) >= self.max_rows
+        self.pane.objects = [row.pane for row in self.rows] + [self.add_button]
+
+
+# share link of a session: the Household as a compact URL query (Climate_store.state_query)
+#   state() returns the session's Household and apply(household) sets its inputs
+#   the page URL follows the shown results, leaving out inputs at their defaults, and a
+#   session opened from a link starts in the linked state; a server session reads the query
+#   from its request, the browser build from the page location once it is known
+class ShareLink:
+
+    def __init__(self,state,apply):
+        self.state = state
+        self.set_state = apply
+        self.defaults = state().key
+        self.location = pn.state.location
+        self.query = ''             # query currently in the page URL
+        self.watcher = None
+        args = [(k,v.decode()) for k,values in pn.state.session_args.items() for v in values]
+        if args:
+            self.apply(urlencode(args))
+        elif self.location is not None:
+            self.watcher = self.location.param.watch(self.located,'search')
+
+    # set the inputs to the state of a query
+    def apply(self,query):
+        key = store.query_state(query,self.defaults)
+        self.set_state(cf.Household.from_key(key))
+        self.query = store.state_query(key,self.defaults)
+
+    # the page location arrived: open the linked state, unless it is the URL written here
+    def located(self,event):
+        query = (event.new or '').lstrip('?')
+        if query and query != self.query:
+            self.location.param.unwatch(self.watcher)
+            self.watcher = None
+            self.apply(query)
+
+    # point the page URL at the state of a shown footprint
+    def update(self,fp):
+        if self.location is None or fp.key is None:
+            return
+        query = store.state_query(fp.key,self.defaults)
+        if query != self.query:
+            self.query = query
+            self.location.search = '?' + query if query else ''
+
+
+# function to return the process-wide pool used for dashboard computations, or None
+def compute_executor(kind=default_executor,workers=default_workers):
+    global _executor
+    if kind not in executor_kinds:
+        raise ValueError('executor must be one of %s, not %r' % (', '.join(executor_kinds),kind))
+    if kind == 'none':
+        return None
+    if _executor is None:
+        if kind == 'thread':
+            _executor = ThreadPoolExecutor(max_workers=workers,thread_name_prefix='ClimateDash')
+        else:
+            # spawned, not forked: forking the running server's threads can deadlock the workers
+            _executor = ProcessPoolExecutor(max_workers=workers,mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+# runs update(*values) when any of the input widgets change, following the update policy
+#   events arriving faster than the rate are coalesced into one pending update that runs
+#   at the end of the interval with the latest widget values; outside a server session
+#   (scripts, notebooks) there is no event loop to defer to, so updates run immediately
+#
+#   with compute given, each update runs update(compute(*values)) instead, and in a server
+#   session compute runs on the shared executor so the event loop stays free for other
+#   sessions; a newer input state cancels the computation it supersedes and only the
+#   latest completed result is shown
+#   state, when given, returns the arguments instead of the widget values, for inputs
+#   that are more than a flat list of widgets (a Household with a variable vehicle list)
+class ThrottledUpdater:
+
+    def __init__(self,update,widgets,mode=default_update_mode,rate=default_update_rate,
+                 compute=None,executor=default_executor,state=None):
+        if mode not in update_modes:
+            raise ValueError('update mode must be one of %s, not %r' % (', '.join(update_modes),mode))
+        self.update = update
+        self.compute = compute
+        self.executor = compute_executor(executor) if compute is not None else None
+        self.state = state
+        self.widgets = []
+        self.watchers = {}
+        self.mode = mode
+        self.interval = 1/rate if rate > 0 else 0
+        self.pending = False
+        self.scheduled = False
+        self.last_run = 0.0
+        self.runs = 0
+        self.events = 0
+        self.generation = 0         # bumped for every new input state
+        self.superseded = 0         # computations cancelled or discarded as out of date
+        self.task = None
+        self.watch(widgets)
+
+    # start following more input widgets (e.g. a vehicle row added to the dashboard)
+    def watch(self,widgets):
+        for w in widgets:
+            sliding = 'value_throttled' in w.param
+            watchers = []
+            if sliding and self.mode != 'immediate':
+                watchers.append(w.param.watch(self.released,'value_throttled'))
+            if not (sliding and self.mode == 'release'):
+                watchers.append(w.param.watch(self.changed,'value'))
+            self.widgets.append(w)
+            self.watchers[id(w)] = watchers
+
+    # stop following input widgets that left the dashboard
+    def unwatch(self,widgets):
+        for w in widgets:
+            for watcher in self.watchers.pop(id(w),[]):
+                w.param.unwatch(watcher)
+            self.widgets.remove(w)
+
+    # the arguments of compute (or update): state() when given, else the widget values
+    def values(self):
+        if self.state is not None:
+            return list(self.state())
+        return [w.value for w in self.widgets]
+
+    # input changed: run now if the interval has passed, otherwise make sure a run is queued
+    def changed(self,*events):
+        self.events += 1
+        metrics.increment('dashboard.events')
+        self.pending = True
+        wait = self.interval - (time.monotonic() - self.last_run)
+        if self.mode == 'immediate' or wait <= 0:
+            self.flush()
+        elif not self.scheduled and not self.schedule(wait):
+            self.flush()
+
+    # slider released: compute the final state without waiting for the interval
+    def released(self,*events):
+        self.events += 1
+        metrics.increment('dashboard.events')
+        self.pending = True
+        self.flush()
+
+    # the current server session document, or None in scripts and notebooks
+    def session_doc(self):
+        doc = pn.state.curdoc
+        if doc is None or doc.session_context is None:
+            return None
+        return doc
+
+    # queue a flush on the session event loop, returns False if there is no session
+    def schedule(self,wait):
+        doc = self.session_doc()
+        if doc is None:
+            return False
+        self.scheduled = True
+        doc.add_timeout_callback(self.flush,int(wait*1000))
+        return True
+
+    def flush(self):
+        self.scheduled = False
+        if not self.pending:
+            return
+        self.pending = False
+        self.last_run = time.monotonic()
+        self.runs += 1
+        values = self.values()
+        if self.compute is None:
+            self.update(*values)
+            return
+        self.generation += 1
+        doc = self.session_doc()
+        if self.executor is None or doc is None:
+            self.show(self.generation,self.last_run,self.compute(*values))
+            return
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            self.discard()
+        self.task = asyncio.ensure_future(self.run(self.generation,self.last_run,values,doc))
+
+    # compute one input state on the executor and show it if nothing newer has arrived
+    async def run(self,generation,started,values,doc):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor,self.compute,*values)
+        except asyncio.CancelledError:
+            return
+        except Exception:
+            log.exception('dashboard computation failed')
+            return
+        doc.add_next_tick_callback(partial(self.show,generation,started,result))
+
+    # apply a completed result under the session lock, unless a newer input state exists
+    #   records the time from the input state being taken to its result being shown
+    def show(self,generation,started,result):
+        if generation != self.generation:
+            self.discard()
+            return
+        self.update(result)
+        metrics.record('dashboard.latency',time.monotonic() - started)
+
+    def discard(self):
+        self.superseded += 1
+        metrics.increment('dashboard.superseded')
@@ -0,0 +1,247 @@
+# Climate Dashboard static web build
+#   writes the Pyodide version of the dashboard to docs/:
+#     app.html          page with the dashboard prerendered, so the layout paints before Python starts
+#     app.js            web worker that boots Pyodide and runs the dashboard
+#     climatedash.zip   the dashboard modules (with precompiled bytecode) and the binary lookup
+#                       tables, instead of the CSVs the lookups are built from
+#   the worker preloads only the packages the dashboard imports (numpy, panel and bokeh with
+#   their dependencies), and keeps the archive and wheels in the browser Cache API, so repeat
+#   visits load them without touching the network; each build is cached under its own key
+#
+#   usage: python Climate_web.py [--out docs]
+
+import argparse
+import hashlib
+import io
+import os
+import py_compile
+import re
+import sys
+import tempfile
+import zipfile
+
+# modules and data files shipped to the browser
+web_modules = ['ClimateDash.py','Climate_fx.py','Climate_data.py','Climate_cache.py',
+               'Climate_metrics.py','Climate_ui.py','Climate_bills.py','Climate_history.py',
+               'Climate_heating.py','Climate_store.py']
+web_data = ['zip_coefficients.npy','zip_coefficients.json','zip_coefficients_stats.npz',
+            'Vehicles_data.csv']
+
+# Pyodide distribution packages loaded before the wheels are installed
+web_packages = ['micropip','numpy']
+# extra requirements installed with micropip alongside the panel and bokeh wheels
+web_requirements = ['pyodide-http==0.2.1']
+# Python version of the Pyodide release, bytecode is only shipped when the build matches
+pyodide_python = (3,11)
+
+# where the archive is unpacked in the Pyodide file system
+web_app_dir = '/home/pyodide/climatedash'
+
+worker_template = r'''importScripts("@PYODIDE_URL@");
+
+// generated by Climate_web.py from ClimateDash.py, do not edit
+const build = '@BUILD@'
+const app_archive = 'climatedash.zip?v=' + build
+const wheels = @WHEELS@
+const packages = @PACKAGES@
+const requirements = @REQUIREMENTS@
+const cache_name = 'climatedash-' + build
+
+function sendPatch(patch, buffers, msg_id) {
+  self.postMessage({
+    type: 'patch',
+    patch: patch,
+    buffers: buffers
+  })
+}
+
+// open this build's cache, deleting the caches of earlier builds
+async function openCache() {
+  if (!self.caches) {
+    return null
+  }
+  for (const key of await caches.keys()) {
+    if (key.startsWith('climatedash-') && key !== cache_name) {
+      await caches.delete(key)
+    }
+  }
+  return caches.open(cache_name)
+}
+
+// fetch a file through the cache, so repeat visits skip the network
+async function cachedFetch(cache, url) {
+  let response = cache ? await cache.match(url) : undefined
+  if (!response) {
+    response = await fetch(url)
+    if (!response.ok) {
+      throw new Error(`${url}: ${response.status}`)
+    }
+    if (cache) {
+      await cache.put(url, response.clone())
+    }
+  }
+  return new Uint8Array(await response.arrayBuffer())
+}
+
+async function startApplication() {
+  self.postMessage({type: 'status', msg: 'Loading pyodide'})
+  const cache = await openCache().catch(() => null)
+  // downloads run while Pyodide boots
+  const archive = cachedFetch(cache, app_archive)
+  const wheel_data = wheels.map((url) => cachedFetch(cache, url))
+  self.pyodide = await loadPyodide();
+  self.pyodide.globals.set("sendPatch", sendPatch);
+  self.postMessage({type: 'status', msg: 'Loading packages'})
+  await self.pyodide.loadPackage(packages)
+  self.postMessage({type: 'status', msg: 'Installing panel'})
+  const install = []
+  for (const [i, url] of wheels.entries()) {
+    const path = '/tmp/' + url.split('/').slice(-1)[0]
+    self.pyodide.FS.writeFile(path, await wheel_data[i])
+    install.push('emfs:' + path)
+  }
+  self.pyodide.globals.set('requirements', install.concat(requirements))
+  await self.pyodide.runPythonAsync(`
+    import micropip
+    await micropip.install(requirements.to_py())
+  `)
+  self.pyodide.unpackArchive(await archive, 'zip', {extractDir: '@APP_DIR@'})
+  self.postMessage({type: 'status', msg: 'Executing code'})
+  const code = `
+import os, sys
+os.chdir('@APP_DIR@')
+sys.path.insert(0, '@APP_DIR@')
+
+from panel.io.pyodide import init_doc, write_doc
+
+init_doc()
+
+import ClimateDash
+ClimateDash.create_app().servable()
+
+await write_doc()
+  `
+
+  try {
+    const [docs_json, render_items, root_ids] = await self.pyodide.runPythonAsync(code)
+    self.postMessage({
+      type: 'render',
+      docs_json: docs_json,
+      render_items: render_items,
+      root_ids: root_ids
+    })
+  } catch(e) {
+    const traceback = `${e}`
+    const tblines = traceback.split('\n')
+    self.postMessage({
+      type: 'status',
+      msg: tblines[tblines.length-2]
+    });
+    throw e
+  }
+}
+
+self.onmessage = async (event) => {
+  const msg = event.data
+  if (msg.type === 'rendered') {
+    self.pyodide.runPythonAsync(`
+    from panel.io.state import state
+    from panel.io.pyodide import _link_docs_worker
+
+    _link_docs_worker(state.curdoc, sendPatch, setter='js')
+    `)
+  } else if (msg.type === 'patch') {
+    self.pyodide.globals.set('patch', msg.patch)
+    self.pyodide.runPythonAsync(`
+    state.curdoc.apply_json_patch(patch.to_py(), setter='js')
+    `)
+    self.postMessage({type: 'idle'})
+  } else if (msg.type === 'location') {
+    self.pyodide.globals.set('location', msg.location)
+    self.pyodide.runPythonAsync(`
+    import json
+    from panel.io.state import state
+    from panel.util import edit_readonly
+    if state.location:
+        loc_data = json.loads(location)
+        with edit_readonly(state.location):
+            state.location.param.update({
+                k: v for k, v in loc_data.items() if k in state.location.param
+            })
+    `)
+  }
+}
+
+startApplication()
+'''
+
+
+# function to return the app archive as bytes
+#   entries are sorted and timestamped alike, so the same sources always give the same archive;
+#   bytecode uses unchecked hashes because unpacking does not keep the source timestamps
+def build_archive(modules=web_modules,data=web_data):
+    compiled = sys.version_info[:2] == pyodide_python
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer,'w') as archive, tempfile.TemporaryDirectory() as tmp:
+        for name in sorted(modules + data):
+            archive.writestr(archive_entry(name),read_file(name))
+            if compiled and name.endswith('.py'):
+                pyc = os.path.join(tmp,name + 'c')
+                py_compile.compile(name,pyc,dfile=name,doraise=True,
+                                   invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+                tag = '__pycache__/%s.cpython-%d%d.pyc' % ((name[:-3],) + pyodide_python)
+                archive.writestr(archive_entry(tag),read_file(pyc))
+    return buffer.getvalue()
+
+# archive entry with a fixed timestamp
+def archive_entry(name):
+    info = zipfile.ZipInfo(name)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+def read_file(path):
+    with open(path,'rb') as f:
+        return f.read()
+
+# function to render the page and its worker for the dashboard
+#   the page comes from panel's converter (prerendered layout, matching bokeh/panel JS),
+#   pointed at the generated worker; returns (html, worker js)
+def build_page(build,script='ClimateDash.py',worker_name='app.js'):
+    from panel.io.convert import BOKEH_CDN_WHL, PANEL_CDN_WHL, PYODIDE_PYC_URL, script_to_html
+    html, _ = script_to_html(script,requirements=[],runtime='pyodide-worker',prerender=True)
+    html = re.sub(r'new Worker\("[^"]*"\)','new Worker("./%s?v=%s")' % (worker_name,build),html)
+    js = worker_template
+    for key,value in {'PYODIDE_URL':PYODIDE_PYC_URL,
+                      'BUILD':build,
+                      'WHEELS':repr([BOKEH_CDN_WHL,PANEL_CDN_WHL]),
+                      'PACKAGES':repr(web_packages),
+                      'REQUIREMENTS':repr(web_requirements),
+                      'APP_DIR':web_app_dir}.items():
+        js = js.replace('@%s@' % key,value)
+    return html, js
+
+# function to write the web build into a directory, returns the written paths
+def build(out='docs'):
+    archive = build_archive()
+    version = hashlib.sha1(archive).hexdigest()[:12]
+    html, js = build_page(version)
+    os.makedirs(out,exist_ok=True)
+    written = []
+    for name,content in (('climatedash.zip',archive),('app.html',html.encode()),('app.js',js.encode())):
+        path = os.path.join(out,name)
+        with open(path,'wb') as f:
+            f.write(content)
+        written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the static Pyodide version of the dashboard')
+    parser.add_argument('--out',default='docs',help='output directory (default docs)')
+    args = parser.parse_args(argv)
+    for path in build(args.out):
+        print('%s (%d KB)' % (path,os.path.getsize(path)//1024))
+
+
+if __name__ == '__main__':
+    main()